@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from database import User
+
+# Configuración de las cachés de autenticación
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+class Principal:
+    """Copia de solo lectura del usuario autenticado, independiente de la sesión"""
+    __slots__ = ("id", "username", "email", "is_admin", "is_active")
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.is_admin = bool(user.is_admin)
+        self.is_active = user.is_active is not False
+
+class TokenCache:
+    """LRU de tokens ya decodificados: token -> (username, expiración)"""
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            item = self._items.get(token)
+            if item is None:
+                return None
+            username, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._items[token]
+                return None
+            self._items.move_to_end(token)
+            return username
+
+    def put(self, token, username, expires_at):
+        with self._lock:
+            self._items[token] = (username, expires_at)
+            self._items.move_to_end(token)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+class PrincipalCache:
+    """Usuarios autenticados por username con un TTL corto"""
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        with self._lock:
+            item = self._items.get(username)
+            if item is None:
+                return None
+            principal, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._items[username]
+                return None
+            return principal
+
+    def put(self, user):
+        principal = Principal(user)
+        with self._lock:
+            self._items[principal.username] = (principal, time.monotonic() + self._ttl)
+        return principal
+
+    def invalidate(self, username):
+        with self._lock:
+            self._items.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL)
+
+# Invalidar al confirmar cambios de un usuario en este proceso; en otros
+# workers el cambio se ve como mucho tras PRINCIPAL_CACHE_TTL segundos.
+# Los usernames se juntan en el flush y se descartan recién después del commit:
+# invalidar antes dejaría que otra petición vuelva a cachear la fila vieja.
+# Los UPDATE masivos (query(User).update(), update(User)) no pasan por estos
+# eventos: después del commit hay que llamar a principal_cache.invalidate(username)
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _collect_changed_user(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        principal_cache.invalidate(target.username)
+        return
+    usernames = session.info.setdefault("changed_usernames", set())
+    usernames.add(target.username)
+    # Si cambió el username también se descarta la entrada anterior
+    usernames.update(inspect(target).attrs.username.history.deleted or ())
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for username in session.info.pop("changed_usernames", ()):
+        principal_cache.invalidate(username)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_usernames", None)
@@ -0,0 +1,110 @@
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from database import SessionLocal, ChatMessage, ChatRoom, ChatArchive, ChatRoomDeletion
+from logs import get_logger
+
+log = get_logger("chat")
+
+# Configuración del borrado por lotes
+CHAT_DELETE_CHUNK_SIZE = int(os.getenv("CHAT_DELETE_CHUNK_SIZE", "1000"))
+CHAT_DELETE_PAUSE = float(os.getenv("CHAT_DELETE_PAUSE", "0.05"))
+
+ACTIVE_STATUSES = ("pending", "running")
+
+def deletion_to_dict(job):
+    return {
+        "job_id": job.id,
+        "room_id": job.room_id,
+        "status": job.status,
+        "messages_deleted": job.messages_deleted or 0,
+        "requested_by": job.requested_by,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def request_room_deletion(db, room, requested_by=None):
+    """Marcar la sala como eliminada y registrar el trabajo de purga"""
+    job = db.query(ChatRoomDeletion).filter(
+        ChatRoomDeletion.room_id == room.room_id,
+        ChatRoomDeletion.status.in_(ACTIVE_STATUSES)
+    ).first()
+    if job:
+        return job, False
+
+    # Los mensajes que lleguen después del borrado no se purgan
+    max_message_id = db.query(func.max(ChatMessage.id)).scalar() or 0
+
+    room.is_active = False
+    job = ChatRoomDeletion(
+        room_id=room.room_id,
+        status="pending",
+        max_message_id=max_message_id,
+        messages_deleted=0,
+        requested_by=requested_by
+    )
+    db.add(job)
+    db.commit()
+    return job, True
+
+def purge_chat_room(job_id):
+    """Borrar los mensajes de la sala en lotes acotados y luego la sala"""
+    db = SessionLocal()
+    try:
+        job = db.get(ChatRoomDeletion, job_id)
+        if not job or job.status not in ACTIVE_STATUSES:
+            return
+        job.status = "running"
+        db.commit()
+
+        while True:
+            ids = [row[0] for row in db.query(ChatMessage.id).filter(
+                ChatMessage.room_id == job.room_id,
+                ChatMessage.id <= job.max_message_id
+            ).limit(CHAT_DELETE_CHUNK_SIZE).all()]
+            if not ids:
+                break
+
+            deleted = db.query(ChatMessage).filter(ChatMessage.id.in_(ids)).delete(synchronize_session=False)
+            job.messages_deleted = (job.messages_deleted or 0) + deleted
+            db.commit()
+
+            if CHAT_DELETE_PAUSE:
+                time.sleep(CHAT_DELETE_PAUSE)
+
+        # Si el usuario volvió a escribir, la sala se reactivó y se conserva
+        db.query(ChatRoom).filter(
+            ChatRoom.room_id == job.room_id,
+            ChatRoom.is_active == False
+        ).delete(synchronize_session=False)
+        db.query(ChatArchive).filter(ChatArchive.room_id == job.room_id).delete(synchronize_session=False)
+
+        job.status = "done"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        log.info("Sala %s eliminada (%s mensajes)", job.room_id, job.messages_deleted)
+    except Exception as e:
+        db.rollback()
+        log.error("Error eliminando sala (trabajo %s): %s", job_id, e)
+        job = db.get(ChatRoomDeletion, job_id)
+        if job:
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+
+def pending_deletion_ids():
+    """Trabajos sin terminar, para retomarlos al reiniciar el servidor"""
+    db = SessionLocal()
+    try:
+        return [row[0] for row in db.query(ChatRoomDeletion.id).filter(
+            ChatRoomDeletion.status.in_(ACTIVE_STATUSES)
+        ).all()]
+    finally:
+        db.close()
@@ -0,0 +1,373 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import text, func
+
+from database import engine, SessionLocal, ChatMessage, ChatArchive
+from logs import get_logger
+
+log = get_logger("chat")
+
+# Configuración de particionado y archivo del chat
+CHAT_PARTITIONING = os.getenv("CHAT_PARTITIONING", "0") == "1"
+CHAT_ARCHIVE_ENABLED = os.getenv("CHAT_ARCHIVE_ENABLED", "0") == "1"
+CHAT_PARTITIONS_AHEAD = int(os.getenv("CHAT_PARTITIONS_AHEAD", "2"))
+CHAT_RETENTION_MONTHS = int(os.getenv("CHAT_RETENTION_MONTHS", "6"))
+CHAT_MAINTENANCE_INTERVAL = int(os.getenv("CHAT_MAINTENANCE_INTERVAL", str(24 * 3600)))
+CHAT_ARCHIVE_BATCH_SIZE = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "1000"))
+CHAT_MIGRATION_BATCH_SIZE = int(os.getenv("CHAT_MIGRATION_BATCH_SIZE", "10000"))
+
+# Tabla particionada que se llena en segundo plano antes del cambio de nombre
+MIGRATION_TABLE = "chat_messages_partitioned"
+MESSAGE_COLUMNS = "id, user_id, username, room_id, message, is_admin, created_at"
+
+def _month_start(value):
+    # Las fechas con zona se pasan a UTC antes de quitarla: el mes es el de UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _add_months(value, months):
+    month_index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+def _period(month):
+    return month.strftime("%Y-%m")
+
+def _partition_name(month):
+    return month.strftime("chat_messages_y%Ym%m")
+
+def _is_postgres():
+    return engine.dialect.name == "postgresql"
+
+def _is_partitioned(conn):
+    relkind = conn.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass('chat_messages')"
+    )).scalar()
+    return relkind == "p"
+
+def _partition_exists(conn, month):
+    return conn.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"), {"name": _partition_name(month)}
+    ).scalar()
+
+def _create_partition(conn, month, parent="chat_messages"):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    ))
+
+def _copy_batch(conn, after_id, up_to_id=None):
+    """Copiar a la tabla nueva las filas con id en (after_id, up_to_id]"""
+    bound = " AND id <= :up_to_id" if up_to_id is not None else ""
+    conn.execute(text(f"""
+        INSERT INTO {MIGRATION_TABLE} ({MESSAGE_COLUMNS})
+        SELECT id, user_id, username, room_id, message, is_admin, COALESCE(created_at, now())
+        FROM chat_messages WHERE id > :after_id{bound}
+    """), {"after_id": after_id, "up_to_id": up_to_id})
+
+def migrate_chat_messages_to_partitioned(batch_size=CHAT_MIGRATION_BATCH_SIZE):
+    """Convertir chat_messages en una tabla particionada por mes (solo PostgreSQL)
+
+    Las filas se copian por lotes sin bloquear la tabla; el bloqueo exclusivo
+    solo dura el cambio de nombre final, que copia lo llegado durante la copia
+    y descarta lo borrado mientras tanto. Se corre aparte del servidor:
+    python chat_partitions.py migrate
+    """
+    if not _is_postgres():
+        return False
+
+    with engine.begin() as conn:
+        if _is_partitioned(conn):
+            return False
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence('chat_messages', 'id')")).scalar()
+        oldest = conn.execute(text("SELECT min(created_at) FROM chat_messages")).scalar()
+
+        # Una corrida cortada deja la tabla nueva a medio llenar: se empieza de cero
+        conn.execute(text(f"DROP TABLE IF EXISTS {MIGRATION_TABLE} CASCADE"))
+        # La clave primaria debe incluir la columna de particionado
+        conn.execute(text(f"""
+            CREATE TABLE {MIGRATION_TABLE} (
+                id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+                user_id INTEGER,
+                username VARCHAR(50) NOT NULL,
+                room_id VARCHAR(100) NOT NULL,
+                message TEXT NOT NULL,
+                is_admin BOOLEAN,
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """))
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS chat_messages_default PARTITION OF {MIGRATION_TABLE} DEFAULT"))
+
+        current = _month_start(datetime.utcnow())
+        month = _month_start(oldest) if oldest else current
+        while month <= _add_months(current, CHAT_PARTITIONS_AHEAD):
+            _create_partition(conn, month, parent=MIGRATION_TABLE)
+            month = _add_months(month, 1)
+
+        # Los índices se crean antes de copiar, con otro nombre hasta el cambio final
+        for index in ChatMessage.__table__.indexes:
+            columns = ", ".join(column.name for column in index.columns)
+            unique = "UNIQUE " if index.unique else ""
+            conn.execute(text(f"CREATE {unique}INDEX {index.name}_new ON {MIGRATION_TABLE} ({columns})"))
+
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            up_to_id = conn.execute(text(
+                "SELECT max(id) FROM (SELECT id FROM chat_messages WHERE id > :after_id ORDER BY id LIMIT :limit) batch"
+            ), {"after_id": last_id, "limit": batch_size}).scalar()
+            if up_to_id is None:
+                break
+            _copy_batch(conn, last_id, up_to_id)
+        last_id = up_to_id
+        log.info("Migración de chat_messages: copiadas hasta id %s", last_id)
+
+    with engine.begin() as conn:
+        conn.execute(text("LOCK TABLE chat_messages IN ACCESS EXCLUSIVE MODE"))
+        # Lo que llegó o se borró durante la copia
+        _copy_batch(conn, last_id)
+        conn.execute(text(f"""
+            DELETE FROM {MIGRATION_TABLE} new_messages
+            WHERE new_messages.id <= :last_id
+              AND NOT EXISTS (SELECT 1 FROM chat_messages old WHERE old.id = new_messages.id)
+        """), {"last_id": last_id})
+
+        # Renombrar la tabla actual y sus índices para liberar los nombres
+        conn.execute(text("ALTER TABLE chat_messages RENAME TO chat_messages_legacy"))
+        conn.execute(text("ALTER TABLE chat_messages_legacy RENAME CONSTRAINT chat_messages_pkey TO chat_messages_legacy_pkey"))
+        for index in ChatMessage.__table__.indexes:
+            conn.execute(text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_legacy"))
+
+        conn.execute(text(f"ALTER TABLE {MIGRATION_TABLE} RENAME TO chat_messages"))
+        conn.execute(text(f"ALTER TABLE chat_messages RENAME CONSTRAINT {MIGRATION_TABLE}_pkey TO chat_messages_pkey"))
+        for index in ChatMessage.__table__.indexes:
+            conn.execute(text(f"ALTER INDEX {index.name}_new RENAME TO {index.name}"))
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY chat_messages.id"))
+        conn.execute(text("DROP TABLE chat_messages_legacy"))
+
+    log.info("chat_messages migrada a tabla particionada por mes")
+    return True
+
+def ensure_chat_partitions(months_ahead=CHAT_PARTITIONS_AHEAD):
+    """Crear por adelantado las particiones del mes actual y los siguientes"""
+    if not _is_postgres():
+        return 0
+
+    created = 0
+    with engine.begin() as conn:
+        if not _is_partitioned(conn):
+            return 0
+        month = _month_start(datetime.utcnow())
+        for _ in range(months_ahead + 1):
+            if not _partition_exists(conn, month):
+                _create_partition(conn, month)
+                created += 1
+            month = _add_months(month, 1)
+    return created
+
+def setup_chat_partitions():
+    """Crear las particiones futuras al iniciar; la migración se corre aparte"""
+    if not CHAT_PARTITIONING or not _is_postgres():
+        return
+    try:
+        with engine.connect() as conn:
+            partitioned = _is_partitioned(conn)
+        if not partitioned:
+            log.warning("CHAT_PARTITIONING=1 pero chat_messages no está particionada: correr python chat_partitions.py migrate")
+            return
+        ensure_chat_partitions()
+    except Exception as e:
+        log.error("Error preparando particiones de chat: %s", e)
+
+def _message_to_dict(msg):
+    return {
+        "id": msg.id,
+        "username": msg.username,
+        "message": msg.message,
+        "is_admin": msg.is_admin,
+        "room_id": msg.room_id,
+        "created_at": msg.created_at.isoformat() if msg.created_at else None
+    }
+
+def _archive_room_month(db, room_id, start, end, delete_rows):
+    """Comprimir los mensajes de una sala en un mes y guardarlos en chat_archives"""
+    period = _period(start)
+    in_range = (
+        ChatMessage.room_id == room_id,
+        ChatMessage.created_at >= start,
+        ChatMessage.created_at < end
+    )
+
+    exists = db.query(ChatArchive.id).filter(
+        ChatArchive.room_id == room_id,
+        ChatArchive.period == period
+    ).first()
+
+    count = 0
+    if not exists:
+        buffer = io.BytesIO()
+        first_at = last_at = None
+        with gzip.GzipFile(fileobj=buffer, mode="wb") as archive_file:
+            messages = db.query(ChatMessage).filter(*in_range)\
+                         .order_by(ChatMessage.created_at, ChatMessage.id)\
+                         .yield_per(CHAT_ARCHIVE_BATCH_SIZE)
+            for msg in messages:
+                archive_file.write(json.dumps(_message_to_dict(msg), ensure_ascii=False).encode() + b"\n")
+                first_at = first_at or msg.created_at
+                last_at = msg.created_at
+                count += 1
+
+        db.add(ChatArchive(
+            room_id=room_id,
+            period=period,
+            message_count=count,
+            first_message_at=first_at,
+            last_message_at=last_at,
+            payload=buffer.getvalue()
+        ))
+
+    if delete_rows:
+        db.query(ChatMessage).filter(*in_range).delete(synchronize_session=False)
+
+    db.commit()
+    return count
+
+def archive_old_chat_messages(retention_months=CHAT_RETENTION_MONTHS):
+    """Mover a chat_archives los meses más antiguos que la ventana de retención"""
+    cutoff = _add_months(_month_start(datetime.utcnow()), -retention_months)
+    archived = 0
+
+    db = SessionLocal()
+    try:
+        oldest = db.query(func.min(ChatMessage.created_at)).filter(
+            ChatMessage.created_at < cutoff
+        ).scalar()
+        if not oldest:
+            return 0
+
+        month = _month_start(oldest)
+        while month < cutoff:
+            end = _add_months(month, 1)
+
+            # Si el mes tiene su propia partición se elimina entera al final
+            has_partition = False
+            if _is_postgres():
+                conn = db.connection()
+                has_partition = _is_partitioned(conn) and _partition_exists(conn, month)
+
+            rooms = db.query(ChatMessage.room_id).filter(
+                ChatMessage.created_at >= month,
+                ChatMessage.created_at < end
+            ).distinct().all()
+            db.commit()
+
+            for (room_id,) in rooms:
+                archived += _archive_room_month(db, room_id, month, end, delete_rows=not has_partition)
+
+            if has_partition:
+                db.execute(text(f"ALTER TABLE chat_messages DETACH PARTITION {_partition_name(month)}"))
+                db.execute(text(f"DROP TABLE {_partition_name(month)}"))
+                db.commit()
+
+            # Saltar directamente al siguiente mes que tenga mensajes
+            next_oldest = db.query(func.min(ChatMessage.created_at)).filter(
+                ChatMessage.created_at >= end,
+                ChatMessage.created_at < cutoff
+            ).scalar()
+            month = _month_start(next_oldest) if next_oldest else cutoff
+
+        if archived:
+            log.info("%s mensajes de chat archivados (anteriores a %s)", archived, _period(cutoff))
+        return archived
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def run_chat_maintenance():
+    """Tarea periódica: crear particiones futuras y archivar meses antiguos"""
+    if CHAT_PARTITIONING:
+        ensure_chat_partitions()
+    # Archivar borra mensajes de chat_messages: solo si se habilitó explícitamente
+    if CHAT_ARCHIVE_ENABLED:
+        archive_old_chat_messages()
+
+def _naive_utc(value):
+    # Los archivos guardan fechas con o sin zona según la base; se comparan en UTC
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def iter_archived_messages(db, room_id=None, start=None, end=None):
+    """Recorrer los mensajes archivados en orden, descomprimiendo un mes a la vez"""
+    query = db.query(ChatArchive.id)
+    if room_id:
+        query = query.filter(ChatArchive.room_id == room_id)
+    if start:
+        query = query.filter(ChatArchive.period >= _period(start))
+    if end:
+        query = query.filter(ChatArchive.period <= _period(end))
+    archive_ids = [archive_id for (archive_id,) in query.order_by(ChatArchive.room_id, ChatArchive.period).all()]
+
+    start = _naive_utc(start) if start else None
+    end = _naive_utc(end) if end else None
+    for archive_id in archive_ids:
+        payload = db.query(ChatArchive.payload).filter(ChatArchive.id == archive_id).scalar()
+        for line in gzip.decompress(payload).splitlines():
+            message = json.loads(line)
+            if start or end:
+                created_at = message.get("created_at")
+                created_at = _naive_utc(datetime.fromisoformat(created_at)) if created_at else None
+                if created_at is None or (start and created_at < start) or (end and created_at >= end):
+                    continue
+            yield message
+
+def list_archived_periods(db, room_id):
+    """Meses archivados de una sala con su cantidad de mensajes"""
+    rows = db.query(ChatArchive.period, ChatArchive.message_count)\
+             .filter(ChatArchive.room_id == room_id)\
+             .order_by(ChatArchive.period).all()
+    return [{"period": period, "message_count": count} for period, count in rows]
+
+def load_archived_messages(db, room_id, period):
+    """Recuperar los mensajes archivados de una sala en un mes"""
+    payload = db.query(ChatArchive.payload).filter(
+        ChatArchive.room_id == room_id,
+        ChatArchive.period == period
+    ).scalar()
+    if payload is None:
+        return []
+    return [json.loads(line) for line in gzip.decompress(payload).splitlines()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chat partitioning and archive maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Convert chat_messages into a monthly partitioned table (PostgreSQL)")
+    migrate.add_argument("--batch-size", type=int, default=CHAT_MIGRATION_BATCH_SIZE, help="rows copied per transaction")
+    subparsers.add_parser("archive", help="Archive the months older than CHAT_RETENTION_MONTHS")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        if not _is_postgres():
+            print("❌ Partitioning is only available on PostgreSQL", file=sys.stderr)
+            return 1
+        if migrate_chat_messages_to_partitioned(args.batch_size):
+            ensure_chat_partitions()
+            print("✅ chat_messages is now partitioned by month")
+        else:
+            print("✅ chat_messages was already partitioned")
+        return 0
+
+    print(f"✅ {archive_old_chat_messages()} messages archived")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
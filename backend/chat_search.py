@@ -0,0 +1,131 @@
+import re
+
+from sqlalchemy import text
+
+from database import engine, ChatMessage
+from logs import get_logger
+
+log = get_logger("chat")
+
+class SearchUnavailable(Exception):
+    """La base configurada no tiene búsqueda de texto completo"""
+
+def _pg_document(alias=""):
+    # Documento indexado: usuario + texto del mensaje, con stemming en español
+    prefix = f"{alias}." if alias else ""
+    return f"to_tsvector('spanish', coalesce({prefix}username, '') || ' ' || coalesce({prefix}message, ''))"
+
+SQLITE_FTS_TABLE = "chat_messages_fts"
+
+def _setup_postgres(conn):
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_chat_messages_fts ON chat_messages USING gin ({_pg_document()})"
+    ))
+
+def _setup_sqlite(conn):
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {"name": SQLITE_FTS_TABLE}).scalar()
+
+    # Tabla FTS5 de contenido externo sincronizada con triggers
+    conn.execute(text(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5(
+            username, message,
+            content='chat_messages', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ai AFTER INSERT ON chat_messages BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}(rowid, username, message) VALUES (new.id, new.username, new.message);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ad AFTER DELETE ON chat_messages BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, username, message) VALUES ('delete', old.id, old.username, old.message);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_au AFTER UPDATE ON chat_messages BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, username, message) VALUES ('delete', old.id, old.username, old.message);
+            INSERT INTO {SQLITE_FTS_TABLE}(rowid, username, message) VALUES (new.id, new.username, new.message);
+        END
+    """))
+
+    # Indexar los mensajes que ya existían
+    if not exists:
+        conn.execute(text(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')"))
+
+def setup_chat_search():
+    """Crear el índice de búsqueda de texto completo del chat"""
+    try:
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                _setup_postgres(conn)
+            elif engine.dialect.name == "sqlite":
+                _setup_sqlite(conn)
+    except Exception as e:
+        log.error("Error creando índice de búsqueda del chat: %s", e)
+
+def _sqlite_match_query(query):
+    # Cada palabra se busca como prefijo; se ignoran los operadores de FTS5
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+def search_chat_messages(db, query, limit=20, offset=0, room_id=None, username=None):
+    """Buscar mensajes por contenido o usuario, ordenados por relevancia"""
+    params = {"limit": limit + 1, "offset": offset}
+    filters = ""
+    if room_id:
+        filters += " AND m.room_id = :room_id"
+        params["room_id"] = room_id
+    if username:
+        filters += " AND m.username = :username"
+        params["username"] = username
+
+    if engine.dialect.name == "postgresql":
+        params["q"] = query
+        sql = f"""
+            SELECT m.id, ts_rank({_pg_document("m")}, q) AS rank
+            FROM chat_messages m, websearch_to_tsquery('spanish', :q) q
+            WHERE {_pg_document("m")} @@ q{filters}
+            ORDER BY rank DESC, m.created_at DESC
+            LIMIT :limit OFFSET :offset
+        """
+    elif engine.dialect.name == "sqlite":
+        params["q"] = _sqlite_match_query(query)
+        if not params["q"]:
+            return [], False
+        # bm25 devuelve valores menores para los resultados más relevantes
+        sql = f"""
+            SELECT m.id, -bm25({SQLITE_FTS_TABLE}) AS rank
+            FROM {SQLITE_FTS_TABLE} JOIN chat_messages m ON m.id = {SQLITE_FTS_TABLE}.rowid
+            WHERE {SQLITE_FTS_TABLE} MATCH :q{filters}
+            ORDER BY rank DESC, m.created_at DESC
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        raise SearchUnavailable(f"Full-text search not supported on {engine.dialect.name}")
+
+    rows = db.execute(text(sql), params).all()
+    has_more = len(rows) > limit
+    ranks = {row[0]: float(row[1]) for row in rows[:limit]}
+    if not ranks:
+        return [], has_more
+
+    messages = db.query(ChatMessage).filter(ChatMessage.id.in_(list(ranks))).all()
+    order = {message_id: position for position, message_id in enumerate(ranks)}
+    messages.sort(key=lambda msg: order[msg.id])
+
+    return [
+        {
+            "id": msg.id,
+            "username": msg.username,
+            "message": msg.message,
+            "is_admin": msg.is_admin,
+            "room_id": msg.room_id,
+            "created_at": msg.created_at.isoformat(),
+            "rank": ranks[msg.id]
+        }
+        for msg in messages
+    ], has_more
@@ -0,0 +1,184 @@
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import or_, case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, Contact, engine
+from logs import get_logger
+
+log = get_logger("contacts")
+
+# Tamaño de lote para completar las claves de contactos existentes
+CONTACT_BACKFILL_BATCH_SIZE = int(os.getenv("CONTACT_BACKFILL_BATCH_SIZE", "500"))
+
+MIN_PHONE_DIGITS = 6
+
+def normalize_phone(phone):
+    """Clave del teléfono: solo dígitos, sin el prefijo internacional 00"""
+    if not phone:
+        return None
+    # El JSON puede traer el teléfono como número
+    digits = re.sub(r"\D", "", str(phone))
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if len(digits) < MIN_PHONE_DIGITS:
+        return None
+    return digits[-20:]
+
+def normalize_email(email):
+    """Clave del email: sin espacios y en minúsculas"""
+    if not email:
+        return None
+    key = str(email).strip().lower()
+    if "@" not in key:
+        return None
+    return key[:120]
+
+def find_contact(db, phone_key, email_key):
+    """Buscar por las claves normalizadas; el teléfono tiene prioridad"""
+    conditions = []
+    if phone_key:
+        conditions.append(Contact.phone_key == phone_key)
+    if email_key:
+        conditions.append(Contact.email_key == email_key)
+    if not conditions:
+        return None
+    query = db.query(Contact).filter(or_(*conditions))
+    if phone_key:
+        query = query.order_by(case((Contact.phone_key == phone_key, 0), else_=1))
+    return query.first()
+
+def _key_taken(db, column, key, contact_id):
+    return db.query(Contact.id).filter(column == key, Contact.id != contact_id).first() is not None
+
+def _record_submission(db, contact, values, phone_key, email_key):
+    contact.submission_count = Contact.submission_count + 1
+    contact.last_seen_at = values["last_seen_at"]
+    contact.message = values["message"]
+    contact.source = values["source"]
+    if values["name"]:
+        contact.name = values["name"]
+    # Completar el dato que faltaba si no pertenece a otro contacto
+    if phone_key and not contact.phone_key and not _key_taken(db, Contact.phone_key, phone_key, contact.id):
+        contact.phone, contact.phone_key = values["phone"], phone_key
+    if email_key and not contact.email_key and not _key_taken(db, Contact.email_key, email_key, contact.id):
+        contact.email, contact.email_key = values["email"], email_key
+    db.commit()
+    return contact
+
+def _insert_statement():
+    return postgresql.insert(Contact) if engine.dialect.name == "postgresql" else sqlite.insert(Contact)
+
+def upsert_contact(db, contact_data):
+    """Registrar una solicitud de contacto sin duplicar teléfono ni email
+
+    Devuelve el contacto y si fue creado.
+    """
+    now = datetime.utcnow()
+    values = {
+        "name": contact_data.get("name"),
+        "phone": contact_data.get("phone"),
+        "email": contact_data.get("email"),
+        "message": contact_data.get("message", "Contacto desde landing page"),
+        "source": contact_data.get("source", "whatsapp"),
+        "last_seen_at": now
+    }
+    phone_key = normalize_phone(values["phone"])
+    email_key = normalize_email(values["email"])
+
+    if not phone_key and not email_key:
+        # Sin datos de contacto no hay con qué deduplicar
+        contact = Contact(**values)
+        db.add(contact)
+        db.commit()
+        return contact, True
+
+    existing = find_contact(db, phone_key, email_key)
+    if existing:
+        return _record_submission(db, existing, values, phone_key, email_key), False
+
+    # Si otra petición insertó el mismo contacto a la vez, se suma a esa fila
+    target = Contact.phone_key if phone_key else Contact.email_key
+    statement = _insert_statement().values(phone_key=phone_key, email_key=email_key, submission_count=1, **values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[target.name],
+        index_where=target.isnot(None),
+        set_={
+            "submission_count": Contact.submission_count + 1,
+            "last_seen_at": statement.excluded.last_seen_at,
+            "message": statement.excluded.message,
+            "source": statement.excluded.source,
+            "name": func.coalesce(statement.excluded.name, Contact.name)
+        }
+    ).returning(Contact.id, Contact.submission_count)
+    try:
+        contact_id, submission_count = db.execute(statement).one()
+        db.commit()
+    except IntegrityError:
+        # El otro dato (email o teléfono) ya pertenece a un contacto
+        db.rollback()
+        existing = find_contact(db, phone_key, email_key)
+        return _record_submission(db, existing, values, phone_key, email_key), False
+    return db.get(Contact, contact_id), submission_count == 1
+
+def _merge_into(owner, duplicate):
+    owner.submission_count = (owner.submission_count or 1) + (duplicate.submission_count or 1)
+    seen = [d for d in (owner.last_seen_at, owner.created_at, duplicate.last_seen_at, duplicate.created_at) if d]
+    owner.last_seen_at = max(seen, key=lambda d: d.replace(tzinfo=None)) if seen else None
+    if duplicate.id > owner.id and duplicate.message:
+        owner.message = duplicate.message
+    owner.name = owner.name or duplicate.name
+
+def backfill_contact_keys():
+    """Calcular las claves de los contactos anteriores y fusionar los duplicados"""
+    db = SessionLocal()
+    merged = 0
+    keyed = 0
+    try:
+        last_id = 0
+        while True:
+            batch = db.query(Contact).filter(
+                Contact.id > last_id,
+                Contact.phone_key.is_(None),
+                Contact.email_key.is_(None),
+                or_(Contact.phone.isnot(None), Contact.email.isnot(None))
+            ).order_by(Contact.id).limit(CONTACT_BACKFILL_BATCH_SIZE).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            for contact in batch:
+                phone_key = normalize_phone(contact.phone)
+                email_key = normalize_email(contact.email)
+                if not phone_key and not email_key:
+                    continue
+                # Los más antiguos se procesan primero y conservan la fila
+                owner = find_contact(db, phone_key, email_key)
+                if owner:
+                    _merge_into(owner, contact)
+                    if phone_key and not owner.phone_key and not _key_taken(db, Contact.phone_key, phone_key, owner.id):
+                        owner.phone, owner.phone_key = contact.phone, phone_key
+                    if email_key and not owner.email_key and not _key_taken(db, Contact.email_key, email_key, owner.id):
+                        owner.email, owner.email_key = contact.email, email_key
+                    db.delete(contact)
+                    merged += 1
+                else:
+                    contact.phone_key = phone_key
+                    contact.email_key = email_key
+                    contact.last_seen_at = contact.last_seen_at or contact.created_at
+                    keyed += 1
+                db.flush()
+            db.commit()
+
+        if keyed or merged:
+            log.info("Contactos normalizados: %s, duplicados fusionados: %s", keyed, merged)
+        return keyed, merged
+    except Exception as e:
+        db.rollback()
+        log.error("Error normalizando contactos: %s", e)
+        return keyed, merged
+    finally:
+        db.close()
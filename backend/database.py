@@ -1,28 +1,79 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, text
+from sqlalchemy import create_engine, event, Column, Integer, Float, String, Text, DateTime, Boolean, LargeBinary, Index, UniqueConstraint, text, inspect
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
 from passlib.context import CryptContext
+import atexit
 import os
+import shutil
+import tempfile
 from dotenv import load_dotenv
 
+from logs import get_logger
+
 load_dotenv()
 
+log = get_logger("db")
+
+# Modo embebido explícito: DATABASE_URL=sqlite:///archivo.db o sqlite:// (en memoria)
 DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    raise RuntimeError("DATABASE_URL is not set (use sqlite:///path.db or sqlite:// for the embedded mode)")
+
+# Configuración del modo SQLite embebido
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def is_sqlite_memory(url):
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+def create_database_engine(url):
+    """Engine de SQLAlchemy; en SQLite aplica los pragmas del modo embebido"""
+    if not url.startswith("sqlite"):
+        return create_engine(url)
+
+    if is_sqlite_memory(url):
+        # Cada conexión en memoria sería una base vacía, y compartir una sola mezcla las
+        # transacciones de distintos hilos (un commit confirma el trabajo de otra sesión).
+        # Un archivo temporal que se borra al salir da un pool normal con WAL y busy_timeout
+        directory = tempfile.mkdtemp(prefix="ares-sqlite-")
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        url = f"sqlite:///{os.path.join(directory, 'embedded.db')}"
+
+    sqlite_engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL: las lecturas no esperan a las escrituras
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+    return sqlite_engine
 
 # Crear el engine de SQLAlchemy
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_database_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Base para los modelos
 Base = declarative_base()
 
 # Configuración para hash de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 # Modelos de base de datos
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        # Un contacto por teléfono y por email normalizados
+        Index("uq_contacts_phone_key", "phone_key", unique=True,
+              postgresql_where=text("phone_key IS NOT NULL"), sqlite_where=text("phone_key IS NOT NULL")),
+        Index("uq_contacts_email_key", "email_key", unique=True,
+              postgresql_where=text("email_key IS NOT NULL"), sqlite_where=text("email_key IS NOT NULL")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=True)
@@ -30,28 +81,89 @@ class Contact(Base):
     email = Column(String(120), nullable=True)
     message = Column(Text, nullable=True)
     source = Column(String(50), default="whatsapp")  # whatsapp, form, etc
+    phone_key = Column(String(20), nullable=True)  # Solo dígitos
+    email_key = Column(String(120), nullable=True)  # En minúsculas y sin espacios
+    submission_count = Column(Integer, nullable=False, default=1, server_default=text("1"))
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class GameInteraction(Base):
     __tablename__ = "game_interactions"
     
     id = Column(Integer, primary_key=True, index=True)
-    game_name = Column(String(100), nullable=False)
+    game_name_id = Column(Integer, nullable=True)  # dim_entity_names.id
     interaction_type = Column(String(50), default="click")  # click, view, etc
+    user_agent_id = Column(Integer, nullable=True)  # dim_user_agents.id
+    ip_address_id = Column(Integer, nullable=True)  # dim_ip_addresses.id
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Texto de filas anteriores a las dimensiones, se vacía al migrarlas
+    game_name = Column(String(100), nullable=True)
     user_agent = Column(Text, nullable=True)
     ip_address = Column(String(45), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class PromoInteraction(Base):
     __tablename__ = "promo_interactions"
     
     id = Column(Integer, primary_key=True, index=True)
-    promo_name = Column(String(100), nullable=False)
+    promo_name_id = Column(Integer, nullable=True)  # dim_entity_names.id
     interaction_type = Column(String(50), default="click")
+    user_agent_id = Column(Integer, nullable=True)  # dim_user_agents.id
+    ip_address_id = Column(Integer, nullable=True)  # dim_ip_addresses.id
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Texto de filas anteriores a las dimensiones, se vacía al migrarlas
+    promo_name = Column(String(100), nullable=True)
     user_agent = Column(Text, nullable=True)
     ip_address = Column(String(45), nullable=True)
+
+# Dimensiones: cada valor repetido se guarda una sola vez y las interacciones usan su id
+class DimEntityName(Base):
+    __tablename__ = "dim_entity_names"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    value = Column(String(100), unique=True, nullable=False)  # Nombre de juego o promoción
+
+class DimUserAgent(Base):
+    __tablename__ = "dim_user_agents"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    value_hash = Column(String(64), unique=True, nullable=False)  # SHA-256, el texto puede ser largo
+    value = Column(Text, nullable=False)
+
+class DimIpAddress(Base):
+    __tablename__ = "dim_ip_addresses"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    value = Column(String(45), unique=True, nullable=False)
+
+class InteractionDailyStat(Base):
+    __tablename__ = "interaction_daily_stats"
+    __table_args__ = (
+        UniqueConstraint("kind", "name", "interaction_type", "day", name="uq_interaction_daily_stats_key"),
+        Index("ix_interaction_daily_stats_kind_day", "kind", "day"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(10), nullable=False)  # game, promo
+    name = Column(String(100), nullable=False)
+    interaction_type = Column(String(50), nullable=False)
+    day = Column(String(10), nullable=False)  # Día agregado, formato YYYY-MM-DD
+    count = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class UniqueVisitorSketch(Base):
+    __tablename__ = "unique_visitor_sketches"
+    __table_args__ = (
+        UniqueConstraint("kind", "name", "day", name="uq_unique_visitor_sketches_key"),
+        Index("ix_unique_visitor_sketches_kind_day", "kind", "day"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(10), nullable=False)  # game, promo
+    name = Column(String(100), nullable=False)
+    day = Column(String(10), nullable=False)  # Formato YYYY-MM-DD
+    registers = Column(LargeBinary, nullable=False)  # Registros HyperLogLog comprimidos con zlib
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class User(Base):
     __tablename__ = "users"
     
@@ -63,8 +175,31 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False, index=True)  # SHA-256 del token
+    user_id = Column(Integer, nullable=False, index=True)
+    family_id = Column(String(32), nullable=False, index=True)  # Cadena de rotaciones de una sesión
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    replaced_by_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class LoginThrottleState(Base):
+    __tablename__ = "login_throttle_state"
+    
+    key = Column(String(200), primary_key=True)  # "ip:<ip>" o "user:<username>"
+    data = Column(Text, nullable=False)  # Estado del limitador en JSON
+    expires_at = Column(Float, nullable=False, index=True)  # Epoch en segundos
+
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Todas las consultas de chat filtran por sala y ordenan por fecha
+        Index("ix_chat_messages_room_created", "room_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=True)  # None para usuarios anónimos
@@ -84,6 +219,34 @@ class ChatRoom(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class ChatArchive(Base):
+    __tablename__ = "chat_archives"
+    __table_args__ = (
+        UniqueConstraint("room_id", "period", name="uq_chat_archives_room_period"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(String(100), nullable=False, index=True)
+    period = Column(String(7), nullable=False)  # Mes archivado, formato YYYY-MM
+    message_count = Column(Integer, nullable=False, default=0)
+    first_message_at = Column(DateTime(timezone=True), nullable=True)
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    payload = Column(LargeBinary, nullable=False)  # NDJSON comprimido con gzip
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ChatRoomDeletion(Base):
+    __tablename__ = "chat_room_deletions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(String(100), nullable=False, index=True)
+    status = Column(String(20), default="pending")  # pending, running, done, failed
+    max_message_id = Column(Integer, nullable=True)  # Solo se borran mensajes hasta este id
+    messages_deleted = Column(Integer, default=0)
+    requested_by = Column(String(50), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
 # Función para obtener la sesión de base de datos
 def get_db():
     db = SessionLocal()
@@ -95,26 +258,43 @@ def get_db():
 # Función para crear las tablas
 def create_tables():
     Base.metadata.create_all(bind=engine)
-    
-    # Crear usuario admin por defecto
-    db = SessionLocal()
-    try:
-        admin_user = db.query(User).filter(User.username == "admin").first()
-        if not admin_user:
-            hashed_password = pwd_context.hash("admin123")
-            admin_user = User(
-                username="admin",
-                email="admin@aresclub.com",
-                hashed_password=hashed_password,
-                is_admin=True
-            )
-            db.add(admin_user)
-            db.commit()
-            print("✅ Usuario admin creado")
-    except Exception as e:
-        print(f"Error creando admin: {e}")
-    finally:
-        db.close()
+    ensure_columns()
+    ensure_indexes()
+    # El usuario admin por defecto se crea en password_pool.ensure_admin_user, con bcrypt fuera del event loop
+
+# Función para agregar columnas nuevas a tablas que ya existían
+def ensure_columns():
+    # create_all no modifica tablas existentes
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg.text}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(ddl))
+                log.info("Columna %s.%s agregada", table.name, column.name)
+            except Exception as e:
+                log.error("Error agregando columna %s.%s: %s", table.name, column.name, e)
+
+# Función para crear índices nuevos en tablas que ya existían
+def ensure_indexes():
+    # create_all solo crea índices junto con tablas nuevas
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                log.error("Error creando índice %s: %s", index.name, e)
 
 # Función para verificar conexión
 def check_db_connection():
@@ -124,23 +304,8 @@ def check_db_connection():
         db.close()
         return True
     except Exception as e:
-        print(f"Error connecting to database: {e}")
-        return False
-
-# Funciones de autenticación
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
+        log.error("Error connecting to database: %s", e)
         return False
-    return user
 
 def generate_room_id(username):
     """Generar un ID único para la sala de chat basado en el username"""
@@ -0,0 +1,257 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine, SessionLocal, GameInteraction, PromoInteraction, DimEntityName, DimUserAgent, DimIpAddress
+from logs import get_logger
+
+log = get_logger("db")
+
+# Configuración de las dimensiones
+DIMENSION_CACHE_SIZE = int(os.getenv("DIMENSION_CACHE_SIZE", "10000"))
+DIMENSION_BACKFILL_BATCH_SIZE = int(os.getenv("DIMENSION_BACKFILL_BATCH_SIZE", "1000"))
+
+class Dimension:
+    """Valores repetidos guardados una vez; el id se resuelve con una caché LRU acotada"""
+
+    def __init__(self, model, key_column, max_size=DIMENSION_CACHE_SIZE, max_length=None, hashed=False):
+        self.model = model
+        self.key_column = key_column
+        self.max_size = max_size
+        self.max_length = max_length
+        self.hashed = hashed
+        self._ids = OrderedDict()  # clave -> id
+        self._values = OrderedDict()  # id -> valor
+        self._lock = threading.Lock()
+
+    def _key(self, value):
+        return hashlib.sha256(value.encode()).hexdigest() if self.hashed else value
+
+    def _remember(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_size:
+                cache.popitem(last=False)
+
+    def _cached(self, cache, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _insert_statement(self):
+        return postgresql.insert(self.model) if engine.dialect.name == "postgresql" else sqlite.insert(self.model)
+
+    def _normalize(self, value):
+        if self.max_length:
+            value = value[:self.max_length]
+        return value, self._key(value)
+
+    def _resolve(self, conn, value, key):
+        row = {"value": value}
+        if self.hashed:
+            row["value_hash"] = key
+        conn.execute(self._insert_statement().values(**row).on_conflict_do_nothing(
+            index_elements=[self.key_column.name]
+        ))
+        return conn.execute(select(self.model.id).where(self.key_column == key)).scalar()
+
+    def _remember_id(self, value, key, dimension_id):
+        self._remember(self._ids, key, dimension_id)
+        self._remember(self._values, dimension_id, value)
+
+    def values(self, db, ids):
+        """Valores de una lista de ids"""
+        resolved = {}
+        missing = []
+        for dimension_id in set(ids):
+            if dimension_id is None:
+                continue
+            value = self._cached(self._values, dimension_id)
+            if value is None:
+                missing.append(dimension_id)
+            else:
+                resolved[dimension_id] = value
+        if missing:
+            for dimension_id, value in db.query(self.model.id, self.model.value).filter(self.model.id.in_(missing)):
+                resolved[dimension_id] = value
+                self._remember(self._values, dimension_id, value)
+        return resolved
+
+def intern_all(pairs):
+    """Ids de varios (dimensión, valor); los que faltan se crean en una sola transacción"""
+    normalized = [dimension._normalize(value) if value is not None else (None, None) for dimension, value in pairs]
+    ids = [
+        dimension._cached(dimension._ids, key) if key is not None else None
+        for (dimension, _), (_, key) in zip(pairs, normalized)
+    ]
+    missing = {
+        (dimension.model.__tablename__, key): (dimension, value, key)
+        for (dimension, _), (value, key), dimension_id in zip(pairs, normalized, ids)
+        if key is not None and dimension_id is None
+    }
+    if not missing:
+        return ids
+
+    # Transacción propia: los ids quedan confirmados aunque la petición falle después.
+    # Siempre en el mismo orden para que dos transacciones no se bloqueen entre sí
+    resolved = {}
+    with engine.begin() as conn:
+        for item in sorted(missing):
+            dimension, value, key = missing[item]
+            resolved[item] = dimension._resolve(conn, value, key)
+    # A la caché solo después del commit
+    for item, dimension_id in resolved.items():
+        dimension, value, key = missing[item]
+        dimension._remember_id(value, key, dimension_id)
+
+    return [
+        resolved.get((dimension.model.__tablename__, key), dimension_id)
+        for (dimension, _), (_, key), dimension_id in zip(pairs, normalized, ids)
+    ]
+
+entity_names = Dimension(DimEntityName, DimEntityName.value, max_length=100)
+user_agents = Dimension(DimUserAgent, DimUserAgent.value_hash, hashed=True)
+ip_addresses = Dimension(DimIpAddress, DimIpAddress.value, max_length=45)
+
+class InteractionSource:
+    """Columnas de una tabla de interacciones con las dimensiones resueltas
+
+    Las filas anteriores a las dimensiones todavía tienen el texto en la propia tabla.
+    """
+
+    def __init__(self, model, name_column, name_id_column):
+        self.model = model
+        self.legacy_name = name_column
+        self.name_id = name_id_column
+        names = DimEntityName.__table__.alias(f"{model.__tablename__}_names")
+        agents = DimUserAgent.__table__.alias(f"{model.__tablename__}_agents")
+        ips = DimIpAddress.__table__.alias(f"{model.__tablename__}_ips")
+        self.from_clause = model.__table__\
+            .outerjoin(names, names.c.id == name_id_column)\
+            .outerjoin(agents, agents.c.id == model.user_agent_id)\
+            .outerjoin(ips, ips.c.id == model.ip_address_id)
+        self.name = func.coalesce(names.c.value, name_column)
+        self.user_agent = func.coalesce(agents.c.value, model.user_agent)
+        self.ip_address = func.coalesce(ips.c.value, model.ip_address)
+        self.columns = {
+            name_column.key: self.name,
+            "user_agent": self.user_agent,
+            "ip_address": self.ip_address
+        }
+
+INTERACTION_SOURCES = {
+    "game": InteractionSource(GameInteraction, GameInteraction.game_name, GameInteraction.game_name_id),
+    "promo": InteractionSource(PromoInteraction, PromoInteraction.promo_name, PromoInteraction.promo_name_id)
+}
+
+# Tablas creadas antes de las dimensiones donde el nombre sigue siendo NOT NULL
+_legacy_name_required = set()
+
+def interaction_values(kind, name, user_agent=None, ip_address=None):
+    """Columnas de una nueva interacción: solo ids de dimensiones"""
+    source = INTERACTION_SOURCES[kind]
+    name_id, user_agent_id, ip_address_id = intern_all([
+        (entity_names, name),
+        (user_agents, user_agent),
+        (ip_addresses, ip_address)
+    ])
+    values = {
+        source.name_id.key: name_id,
+        "user_agent_id": user_agent_id,
+        "ip_address_id": ip_address_id
+    }
+    if kind in _legacy_name_required:
+        values[source.legacy_name.key] = name
+    return values
+
+def interaction_counts_by_name(db, kind):
+    """Interacciones sin compactar agrupadas por nombre, agrupando primero por id"""
+    source = INTERACTION_SOURCES[kind]
+    by_id = db.query(source.name_id, func.count(source.model.id)).filter(
+        source.name_id.isnot(None)
+    ).group_by(source.name_id).all()
+    names = entity_names.values(db, [name_id for name_id, _ in by_id])
+
+    counts = {}
+    for name_id, count in by_id:
+        name = names.get(name_id)
+        counts[name] = counts.get(name, 0) + count
+    for name, count in db.query(source.legacy_name, func.count(source.model.id)).filter(
+        source.name_id.is_(None), source.legacy_name.isnot(None)
+    ).group_by(source.legacy_name).all():
+        counts[name] = counts.get(name, 0) + count
+    return counts
+
+def setup_interaction_dimensions():
+    """Permitir nombres nulos en tablas anteriores a las dimensiones"""
+    columns_by_table = {}
+    inspector = inspect(engine)
+    for kind, source in INTERACTION_SOURCES.items():
+        table = source.model.__tablename__
+        columns_by_table[table] = {c["name"]: c for c in inspector.get_columns(table)}
+        column = columns_by_table[table].get(source.legacy_name.key)
+        if not column or column["nullable"]:
+            continue
+        if engine.dialect.name == "postgresql":
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {source.legacy_name.key} DROP NOT NULL"))
+                continue
+            except Exception as e:
+                log.error("Error quitando NOT NULL de %s.%s: %s", table, source.legacy_name.key, e)
+        # SQLite no puede modificar la columna: se sigue guardando el nombre
+        _legacy_name_required.add(kind)
+
+def backfill_interaction_dimensions():
+    """Pasar las filas anteriores a ids de dimensiones y vaciar su texto"""
+    migrated = 0
+    db = SessionLocal()
+    try:
+        for kind, source in INTERACTION_SOURCES.items():
+            model = source.model
+            last_id = 0
+            while True:
+                batch = db.query(model).filter(
+                    model.id > last_id,
+                    source.name_id.is_(None),
+                    source.legacy_name.isnot(None)
+                ).order_by(model.id).limit(DIMENSION_BACKFILL_BATCH_SIZE).all()
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                ids = intern_all([
+                    pair for row in batch for pair in (
+                        (entity_names, getattr(row, source.legacy_name.key)),
+                        (user_agents, row.user_agent),
+                        (ip_addresses, row.ip_address)
+                    )
+                ])
+                for index, row in enumerate(batch):
+                    name_id, user_agent_id, ip_address_id = ids[index * 3:index * 3 + 3]
+                    setattr(row, source.name_id.key, name_id)
+                    row.user_agent_id = user_agent_id
+                    row.ip_address_id = ip_address_id
+                    row.user_agent = None
+                    row.ip_address = None
+                    if kind not in _legacy_name_required:
+                        setattr(row, source.legacy_name.key, None)
+                db.commit()
+                migrated += len(batch)
+
+        if migrated:
+            log.info("Interacciones migradas a dimensiones: %s", migrated)
+        return migrated
+    except Exception as e:
+        db.rollback()
+        log.error("Error migrando interacciones a dimensiones: %s", e)
+        return migrated
+    finally:
+        db.close()
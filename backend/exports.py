@@ -0,0 +1,169 @@
+import csv
+import io
+import itertools
+import json
+import os
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+
+from chat_partitions import iter_archived_messages
+from database import ChatMessage, Contact, GameInteraction, PromoInteraction
+from dimensions import INTERACTION_SOURCES
+from read_replica import read_router
+
+# Configuración de las exportaciones
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+# Tablas exportables: modelo, columnas y columnas usadas por los filtros
+EXPORT_ENTITIES = {
+    "contacts": {
+        "model": Contact,
+        "columns": ["id", "name", "phone", "email", "message", "source", "submission_count", "last_seen_at", "created_at"],
+        "source": Contact.source,
+        "name": None
+    },
+    "game_interactions": {
+        "model": GameInteraction,
+        "columns": ["id", "game_name", "interaction_type", "user_agent", "ip_address", "created_at"],
+        "source": GameInteraction.interaction_type,
+        "name": INTERACTION_SOURCES["game"].name,
+        "dimensions": INTERACTION_SOURCES["game"]
+    },
+    "promo_interactions": {
+        "model": PromoInteraction,
+        "columns": ["id", "promo_name", "interaction_type", "user_agent", "ip_address", "created_at"],
+        "source": PromoInteraction.interaction_type,
+        "name": INTERACTION_SOURCES["promo"].name,
+        "dimensions": INTERACTION_SOURCES["promo"]
+    }
+}
+
+CHAT_EXPORT_COLUMNS = ["id", "room_id", "user_id", "username", "message", "is_admin", "created_at"]
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def iter_rows(statement, batch_size=EXPORT_BATCH_SIZE):
+    """Recorrer el resultado con un cursor del lado del servidor, sin cargarlo entero"""
+    db = read_router.session()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        for row in result:
+            yield row._mapping
+    finally:
+        db.close()
+
+def ndjson_lines(rows, columns):
+    for row in rows:
+        record = {column: _serialize(row[column]) for column in columns}
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+def csv_lines(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_serialize(row[column]) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Cabecera si no hubo filas
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def encode_lines(rows, columns, export_format):
+    """Serializar filas en el formato pedido, agrupando la salida en bloques"""
+    lines = ndjson_lines(rows, columns) if export_format == "ndjson" else csv_lines(rows, columns)
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(chunk).encode("utf-8")
+            chunk = []
+            size = 0
+    if chunk:
+        yield "".join(chunk).encode("utf-8")
+
+def chat_export_statement(room_id=None, start=None, end=None):
+    """Consulta de mensajes de una sala o de todas las salas en un rango de fechas"""
+    statement = select(*[getattr(ChatMessage, column) for column in CHAT_EXPORT_COLUMNS])
+    if room_id:
+        statement = statement.where(ChatMessage.room_id == room_id)
+    if start:
+        statement = statement.where(ChatMessage.created_at >= start)
+    if end:
+        statement = statement.where(ChatMessage.created_at < end)
+
+    if room_id:
+        return statement.order_by(ChatMessage.created_at, ChatMessage.id)
+    return statement.order_by(ChatMessage.room_id, ChatMessage.created_at, ChatMessage.id)
+
+def iter_archived_rows(room_id=None, start=None, end=None):
+    """Mensajes de chat_archives con las mismas columnas que la exportación"""
+    db = read_router.session()
+    try:
+        for message in iter_archived_messages(db, room_id, start, end):
+            yield {column: message.get(column) for column in CHAT_EXPORT_COLUMNS}
+    finally:
+        db.close()
+
+def stream_chat_export(room_id=None, start=None, end=None, export_format="ndjson", include_archived=True):
+    rows = iter_rows(chat_export_statement(room_id, start, end))
+    if include_archived:
+        # Los meses archivados son anteriores a los que siguen en chat_messages
+        rows = itertools.chain(iter_archived_rows(room_id, start, end), rows)
+    return encode_lines(rows, CHAT_EXPORT_COLUMNS, export_format)
+
+def gzip_chunks(chunks):
+    """Comprimir al vuelo la salida de una exportación"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def entity_export_statement(entity, start=None, end=None, source=None, name=None, after_id=None, limit=None):
+    """Consulta paginada por id para poder retomar una exportación cortada"""
+    config = EXPORT_ENTITIES[entity]
+    model = config["model"]
+    dimensions = config.get("dimensions")
+    if dimensions:
+        # Nombre, user agent e IP se leen de las tablas de dimensiones
+        statement = select(*[
+            dimensions.columns[column].label(column) if column in dimensions.columns else getattr(model, column)
+            for column in config["columns"]
+        ]).select_from(dimensions.from_clause)
+    else:
+        statement = select(*[getattr(model, column) for column in config["columns"]])
+    if after_id:
+        statement = statement.where(model.id > after_id)
+    if start:
+        statement = statement.where(model.created_at >= start)
+    if end:
+        statement = statement.where(model.created_at < end)
+    if source and config["source"] is not None:
+        statement = statement.where(config["source"] == source)
+    if name and config["name"] is not None:
+        statement = statement.where(config["name"] == name)
+    statement = statement.order_by(model.id)
+    if limit:
+        statement = statement.limit(limit)
+    return statement
+
+def stream_entity_export(entity, export_format="csv", compress=False, **filters):
+    rows = iter_rows(entity_export_statement(entity, **filters))
+    chunks = encode_lines(rows, EXPORT_ENTITIES[entity]["columns"], export_format)
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,34 @@
+import asyncio
+
+from logs import get_logger
+
+log = get_logger("jobs")
+
+# Tareas en segundo plano lanzadas por el servidor
+_background_tasks = set()
+
+def spawn(func, *args):
+    """Ejecutar una función bloqueante en un hilo sin esperar el resultado"""
+    task = asyncio.create_task(asyncio.to_thread(func, *args))
+    # Guardar referencia para que la tarea no sea recolectada antes de terminar
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def run_periodically(name, interval_seconds, func, initial_delay=0):
+    """Ejecutar una función bloqueante cada cierto intervalo en un hilo aparte"""
+    if initial_delay:
+        await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            await asyncio.to_thread(func)
+        except Exception as e:
+            log.exception("Error en tarea programada %s: %s", name, e)
+        await asyncio.sleep(interval_seconds)
+
+def schedule(name, interval_seconds, func, initial_delay=0):
+    """Registrar una tarea periódica en el event loop actual"""
+    task = asyncio.create_task(run_periodically(name, interval_seconds, func, initial_delay))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine, SessionLocal, LoginThrottleState
+
+# Configuración del limitador de intentos de login
+LOGIN_THROTTLE_BACKEND = os.getenv("LOGIN_THROTTLE_BACKEND", "memory")  # memory, database
+LOGIN_THROTTLE_WINDOW = float(os.getenv("LOGIN_THROTTLE_WINDOW", "300"))
+LOGIN_THROTTLE_MAX_ATTEMPTS = int(os.getenv("LOGIN_THROTTLE_MAX_ATTEMPTS", "5"))
+LOGIN_THROTTLE_MAX_ATTEMPTS_IP = int(os.getenv("LOGIN_THROTTLE_MAX_ATTEMPTS_IP", "20"))
+LOGIN_THROTTLE_LOCKOUT = float(os.getenv("LOGIN_THROTTLE_LOCKOUT", "30"))
+LOGIN_THROTTLE_MAX_LOCKOUT = float(os.getenv("LOGIN_THROTTLE_MAX_LOCKOUT", "3600"))
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+LOGIN_THROTTLE_WAIT = float(os.getenv("LOGIN_THROTTLE_WAIT", "10"))
+LOGIN_THROTTLE_PENDING_TIMEOUT = float(os.getenv("LOGIN_THROTTLE_PENDING_TIMEOUT", "60"))
+LOGIN_THROTTLE_POLL_INTERVAL = 0.05
+
+def _insert_statement():
+    return postgresql.insert(LoginThrottleState) if engine.dialect.name == "postgresql" else sqlite.insert(LoginThrottleState)
+
+class MemoryThrottleBackend:
+    """Estado en memoria del proceso; cada worker limita por separado"""
+
+    def __init__(self, max_keys):
+        self._items = {}
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            state, expires_at = item
+            if expires_at <= time.time():
+                del self._items[key]
+                return None
+            return dict(state)
+
+    def update(self, key, apply):
+        """Leer, modificar y guardar el estado de una clave sin que otro hilo se intercale"""
+        with self._lock:
+            item = self._items.get(key)
+            state = dict(item[0]) if item is not None and item[1] > time.time() else None
+            state, expires_at = apply(state)
+            if len(self._items) >= self._max_keys and key not in self._items:
+                self._prune()
+            self._items[key] = (dict(state), expires_at)
+            return state
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def _prune(self):
+        now = time.time()
+        for key in [key for key, (_, expires_at) in self._items.items() if expires_at <= now]:
+            del self._items[key]
+        # Si sigue lleno se descartan las entradas que vencen antes
+        if len(self._items) >= self._max_keys:
+            oldest = sorted(self._items, key=lambda key: self._items[key][1])
+            for key in oldest[:len(oldest) // 10 + 1]:
+                del self._items[key]
+
+class DatabaseThrottleBackend:
+    """Estado compartido entre workers en la tabla login_throttle_state"""
+
+    def get(self, key):
+        db = SessionLocal()
+        try:
+            row = db.get(LoginThrottleState, key)
+            if row is None or row.expires_at <= time.time():
+                return None
+            return json.loads(row.data)
+        finally:
+            db.close()
+
+    def update(self, key, apply):
+        """Leer, modificar y guardar el estado de una clave con la fila bloqueada"""
+        db = SessionLocal()
+        try:
+            # Crear la fila si falta para poder bloquearla; en SQLite esta escritura
+            # ya toma el lock de la base y serializa a los demás workers
+            db.execute(_insert_statement().values(key=key, data="null", expires_at=0).on_conflict_do_nothing(
+                index_elements=["key"]
+            ))
+            row = db.query(LoginThrottleState).filter(LoginThrottleState.key == key).with_for_update().one()
+            state = json.loads(row.data) if row.expires_at > time.time() else None
+            state, row.expires_at = apply(state)
+            row.data = json.dumps(state)
+            db.commit()
+            return state
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def delete(self, key):
+        db = SessionLocal()
+        try:
+            db.query(LoginThrottleState).filter(LoginThrottleState.key == key).delete()
+            # Aprovechar para limpiar entradas vencidas
+            db.query(LoginThrottleState).filter(LoginThrottleState.expires_at <= time.time()).delete()
+            db.commit()
+        finally:
+            db.close()
+
+class LoginThrottleBusy(Exception):
+    """Ya hay tantos intentos en curso como fallos quedan antes del bloqueo"""
+
+class LoginThrottle:
+    """Ventana deslizante de fallos por IP y por usuario con bloqueo exponencial
+
+    El bloqueo depende solo de fallos confirmados. Los intentos que todavía
+    calculan bcrypt van aparte, en "pending", y no pueden superar los fallos
+    que quedan antes del bloqueo: una ráfaga en paralelo no prueba más
+    contraseñas que el límite, y los logins correctos en paralelo esperan
+    su turno en vez de bloquear al usuario.
+    """
+
+    def __init__(self, backend, window, max_attempts, max_attempts_ip, lockout, max_lockout,
+                 pending_timeout=LOGIN_THROTTLE_PENDING_TIMEOUT):
+        self.backend = backend
+        self.window = window
+        self.max_attempts = max_attempts
+        self.max_attempts_ip = max_attempts_ip
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+        self.pending_timeout = pending_timeout
+
+    def keys_for(self, ip_address, username):
+        return [f"ip:{ip_address}", f"user:{username.strip().lower()}"]
+
+    def _limit(self, key):
+        return self.max_attempts_ip if key.startswith("ip:") else self.max_attempts
+
+    def check(self, keys):
+        """Segundos que faltan para poder intentar de nuevo (0 si no hay bloqueo)"""
+        now = time.time()
+        retry_after = 0
+        for key in keys:
+            state = self.backend.get(key)
+            if state and state.get("locked_until", 0) > now:
+                retry_after = max(retry_after, state["locked_until"] - now)
+        return retry_after
+
+    def _new_state(self):
+        return {"failures": [], "pending": [], "lockouts": 0, "locked_until": 0}
+
+    def _current(self, state, now):
+        state = state or self._new_state()
+        state["failures"] = [t for t in state["failures"] if t > now - self.window]
+        # Un intento sin resolver (worker caído a mitad) deja de contar tras pending_timeout
+        state["pending"] = [t for t in state.get("pending", []) if t > now - self.pending_timeout]
+        return state
+
+    def _expires_at(self, state, now):
+        # El historial de bloqueos se olvida tras un periodo sin fallos
+        return max(now + self.window, state["locked_until"]) + self.max_lockout
+
+    def begin_attempt(self, keys):
+        """Reservar el intento antes de calcular bcrypt
+
+        Devuelve los segundos de bloqueo (0 si puede seguir) y la marca del
+        intento, que se pasa luego a record_success, record_failure o release.
+        Lanza LoginThrottleBusy si ya hay demasiados intentos en curso.
+        """
+        retry_after = self.check(keys)
+        if retry_after:
+            return retry_after, None
+
+        now = time.time()
+        busy = False
+        for key in keys:
+            limit = self._limit(key)
+            accepted = []
+
+            def apply(state, limit=limit, accepted=accepted):
+                state = self._current(state, now)
+                if state["locked_until"] <= now and len(state["failures"]) + len(state["pending"]) < limit:
+                    state["pending"].append(now)
+                    accepted.append(True)
+                return state, self._expires_at(state, now)
+
+            state = self.backend.update(key, apply)
+            if state["locked_until"] > now:
+                retry_after = max(retry_after, state["locked_until"] - now)
+            elif not accepted:
+                busy = True
+        if retry_after or busy:
+            # Rechazado por alguna clave: el intento no queda reservado en las demás
+            self.release(keys, now)
+            if busy and not retry_after:
+                raise LoginThrottleBusy()
+            return retry_after, None
+        return 0, now
+
+    async def acquire(self, keys, wait=LOGIN_THROTTLE_WAIT):
+        """begin_attempt esperando hasta `wait` segundos a que termine algún intento en curso"""
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                return self.begin_attempt(keys)
+            except LoginThrottleBusy:
+                if time.monotonic() >= deadline:
+                    raise
+                await asyncio.sleep(LOGIN_THROTTLE_POLL_INTERVAL)
+
+    def _settle(self, keys, attempt, settle):
+        now = time.time()
+
+        def apply(state):
+            state = self._current(state, now)
+            if attempt in state["pending"]:
+                state["pending"].remove(attempt)
+            settle(state, now)
+            return state, self._expires_at(state, now)
+
+        for key in keys:
+            self.backend.update(key, apply)
+
+    def release(self, keys, attempt):
+        """Liberar un intento que no llegó a validar la contraseña"""
+        if attempt is None:
+            return
+        self._settle(keys, attempt, lambda state, now: None)
+
+    def record_failure(self, keys, attempt):
+        """Convertir el intento en un fallo confirmado; al llegar al límite se bloquea"""
+        for key in keys:
+            limit = self._limit(key)
+
+            def settle(state, now, limit=limit):
+                state["failures"].append(now)
+                if len(state["failures"]) >= limit and state["locked_until"] <= now:
+                    # Cada bloqueo sucesivo dura el doble que el anterior
+                    state["lockouts"] += 1
+                    duration = min(self.lockout * 2 ** (state["lockouts"] - 1), self.max_lockout)
+                    state["locked_until"] = now + duration
+                    state["failures"] = []
+
+            self._settle([key], attempt, settle)
+
+    def record_success(self, keys, attempt):
+        # Se limpian los fallos del usuario; en la IP solo se libera este intento,
+        # un login válido no debe borrar los fallos de otros usuarios
+        def clear_user(state, now):
+            state["failures"] = []
+            state["lockouts"] = 0
+
+        self._settle([key for key in keys if key.startswith("user:")], attempt, clear_user)
+        self.release([key for key in keys if not key.startswith("user:")], attempt)
+
+def _create_backend():
+    if LOGIN_THROTTLE_BACKEND == "database":
+        return DatabaseThrottleBackend()
+    return MemoryThrottleBackend(LOGIN_THROTTLE_MAX_KEYS)
+
+login_throttle = LoginThrottle(
+    _create_backend(),
+    window=LOGIN_THROTTLE_WINDOW,
+    max_attempts=LOGIN_THROTTLE_MAX_ATTEMPTS,
+    max_attempts_ip=LOGIN_THROTTLE_MAX_ATTEMPTS_IP,
+    lockout=LOGIN_THROTTLE_LOCKOUT,
+    max_lockout=LOGIN_THROTTLE_MAX_LOCKOUT
+)
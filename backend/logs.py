@@ -0,0 +1,146 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from metrics import registry, Counter
+
+# Configuración de logs
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json, text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Nivel por subsistema, por ejemplo "auth=debug,socketio=info,sql=info,chat=off"
+LOG_SUBSYSTEMS = os.getenv("LOG_SUBSYSTEMS", "")
+# Fracción de eventos frecuentes que se registran, por ejemplo "chat.message=0.1"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "socket.connect=0.1,socket.disconnect=0.1,chat.message=0.1")
+
+ROOT_LOGGER = "ares"
+OFF = logging.CRITICAL + 10
+
+# Niveles por defecto de subsistemas muy verbosos
+DEFAULT_SUBSYSTEM_LEVELS = {
+    "socketio": "warning",
+    "engineio": "warning"
+}
+
+# Subsistemas que corresponden a loggers de librerías externas
+EXTERNAL_LOGGERS = {
+    "sql": "sqlalchemy.engine"
+}
+
+def _parse_pairs(value):
+    pairs = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, setting = item.split("=", 1)
+            pairs[key.strip()] = setting.strip()
+    return pairs
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        event = getattr(record, "event", None)
+        if event:
+            entry["event"] = event
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Descarta al azar una parte de los eventos configurados"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, "event", None))
+        return rate is None or random.random() < rate
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Encola el registro sin bloquear; si la cola está llena se descarta"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolver el mensaje ahora y dejar el formateo al hilo del listener
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_handler = None
+_listener = None
+
+def setup_logging():
+    """Configurar los loggers de la aplicación con escritura en un hilo aparte"""
+    global _handler, _listener
+    if _handler is not None:
+        return _handler
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+
+    _handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    _handler.addFilter(SamplingFilter({
+        event: float(rate) for event, rate in _parse_pairs(LOG_SAMPLING).items()
+    }))
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.addHandler(_handler)
+    root.propagate = False
+
+    levels = dict(DEFAULT_SUBSYSTEM_LEVELS, **_parse_pairs(LOG_SUBSYSTEMS))
+    for subsystem, level in levels.items():
+        numeric_level = OFF if level.lower() == "off" else getattr(logging, level.upper(), logging.INFO)
+        if subsystem in EXTERNAL_LOGGERS:
+            external = logging.getLogger(EXTERNAL_LOGGERS[subsystem])
+            external.setLevel(numeric_level)
+            external.addHandler(_handler)
+            external.propagate = False
+        else:
+            logging.getLogger(f"{ROOT_LOGGER}.{subsystem}").setLevel(numeric_level)
+
+    return _handler
+
+def get_logger(subsystem):
+    return logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+registry.register(Counter(
+    "log_records_dropped_total", "Registros de log descartados por cola llena",
+    callback=dropped_records))
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from logs import get_logger
+from metrics import registry, Counter, Gauge, Histogram
+
+log = get_logger("loop")
+
+# Configuración del monitor del event loop
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))
+LOOP_BLOCK_HISTORY = int(os.getenv("LOOP_BLOCK_HISTORY", "50"))
+LOOP_BLOCK_STACK_DEPTH = int(os.getenv("LOOP_BLOCK_STACK_DEPTH", "30"))
+
+LOOP_LAG = registry.register(Histogram(
+    "event_loop_lag_seconds", "Retraso de planificación del event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)))
+LOOP_LAG_LAST = registry.register(Gauge(
+    "event_loop_lag_last_seconds", "Último retraso medido del event loop"))
+LOOP_BLOCKS = registry.register(Counter(
+    "event_loop_blocked_total", "Bloqueos del event loop por encima del umbral"))
+
+class LoopLagMonitor:
+    """Mide el retraso del event loop y captura la pila cuando queda bloqueado"""
+
+    def __init__(self, interval, threshold, history):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocks = deque(maxlen=history)
+        self._heartbeat = time.monotonic()
+        self._captured = False
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._task = None
+        self._thread = None
+
+    async def _measure(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+            self._heartbeat = time.monotonic()
+            self._captured = False
+
+    def _watch(self):
+        # Si el latido no llega a tiempo el loop está bloqueado en este momento
+        while not self._stop.wait(self.interval / 2):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled > self.threshold and not self._captured:
+                self._captured = True
+                self._capture(stalled)
+
+    def _capture(self, stalled):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None and len(stack) < LOOP_BLOCK_STACK_DEPTH:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        # La llamada que bloquea queda primera
+        LOOP_BLOCKS.inc()
+        self.blocks.append({
+            "detected_at": time.time(),
+            "blocked_seconds": round(stalled, 4),
+            "stack": stack
+        })
+        log.warning("Event loop bloqueado %.3fs en %s", stalled, stack[0] if stack else "?",
+                    extra={"event": "loop.blocked", "fields": {"stack": stack}})
+
+    def start(self):
+        """Arrancar desde el event loop que se quiere vigilar"""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+        return self._task
+
+    def stop(self):
+        self._stop.set()
+
+    def recent_blocks(self):
+        return list(reversed(self.blocks))
+
+loop_monitor = LoopLagMonitor(LOOP_MONITOR_INTERVAL, LOOP_BLOCK_THRESHOLD, LOOP_BLOCK_HISTORY)
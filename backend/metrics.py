@@ -0,0 +1,233 @@
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+# Token opcional para proteger /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FANOUT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Métrica con etiquetas; cada una tiene su propio lock de sección corta"""
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        # callback() devuelve un valor o un dict {etiquetas: valor} al momento del scrape
+        self._callback = callback
+        if not self.labelnames and self.type in ("counter", "gauge"):
+            self._values[()] = 0
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def _items(self):
+        if self._callback is not None:
+            value = self._callback()
+            return list(value.items()) if isinstance(value, dict) else [((), value)]
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self):
+        try:
+            items = self._items()
+        except Exception:
+            return []
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [conteos por bucket (+Inf al final), suma, total]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items()]
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# HTTP
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "Peticiones HTTP por ruta, método y código", ("method", "route", "status")))
+HTTP_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP", ("method", "route")))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Peticiones HTTP en curso"))
+
+# Socket.IO
+SOCKET_CLIENTS = registry.register(Gauge(
+    "socketio_connected_clients", "Clientes Socket.IO conectados"))
+SOCKET_EVENTS = registry.register(Counter(
+    "socketio_events_total", "Eventos Socket.IO recibidos por tipo", ("event",)))
+SOCKET_FANOUT = registry.register(Histogram(
+    "socketio_emit_recipients", "Destinatarios de cada emit por evento", ("event",), buckets=FANOUT_BUCKETS))
+
+# Base de datos
+DB_QUERIES = registry.register(Counter(
+    "db_queries_total", "Consultas SQL ejecutadas por ruta", ("route",)))
+DB_LATENCY = registry.register(Histogram(
+    "db_query_duration_seconds", "Latencia de las consultas SQL por ruta", ("route",)))
+
+# Petición en curso, visible también desde los hilos del threadpool
+_request_scope = contextvars.ContextVar("metrics_request_scope", default=None)
+
+def _route_label(scope):
+    # FastAPI deja la ruta resuelta en el scope; se usa la plantilla para
+    # no crear una serie por cada id
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched") if route is not None else "unmatched"
+
+def current_route():
+    scope = _request_scope.get()
+    return _route_label(scope) if scope is not None else "background"
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada petición HTTP"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+        token = _request_scope.set(scope)
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = _route_label(scope)
+            method = scope.get("method", "GET")
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUESTS.inc(method, route, str(status[0]))
+            HTTP_LATENCY.observe(time.perf_counter() - start, method, route)
+            _request_scope.reset(token)
+
+def instrument_engine(engine, name="db"):
+    """Contar y medir las consultas SQL del engine"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        route = current_route()
+        DB_QUERIES.inc(route)
+        DB_LATENCY.observe(elapsed, route)
+
+    pool = engine.pool
+    registry.register(Gauge(
+        f"{name}_pool_checked_out", "Conexiones del pool en uso",
+        callback=lambda: pool.checkedout() if hasattr(pool, "checkedout") else 0))
+    registry.register(Gauge(
+        f"{name}_pool_size", "Tamaño configurado del pool",
+        callback=lambda: pool.size() if hasattr(pool, "size") else 0))
+
+def socket_event(handler):
+    """Decorador que cuenta los eventos Socket.IO por tipo"""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        SOCKET_EVENTS.inc(handler.__name__)
+        return await handler(*args, **kwargs)
+    return wrapper
+
+def render():
+    return registry.render()
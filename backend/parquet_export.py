@@ -0,0 +1,245 @@
+# Exportación incremental a Parquet para análisis fuera de línea
+#
+# Uso: python parquet_export.py --output analytics [--tables contacts,chat_messages]
+#
+# Cada tabla se lee por lotes ordenados por id y se escribe particionada por día
+# (<tabla>/date=YYYY-MM-DD/part-<primer id>-<último id>.parquet). El último id
+# exportado de cada tabla queda en <output>/_state.json, así la siguiente
+# corrida solo agrega las filas nuevas. Solo se exportan filas creadas hace más
+# de PARQUET_SAFETY_MARGIN segundos: un id menor que se confirma tarde no queda
+# detrás del último id guardado.
+#
+# contacts se actualiza en el lugar y se fusiona, así que se reescribe entera en
+# cada corrida (contacts/snapshot.parquet) en vez de avanzar por id.
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Integer, func, select
+
+from database import ChatMessage
+from exports import entity_export_statement
+from logs import get_logger
+from read_replica import read_router
+
+log = get_logger("exports")
+
+# Configuración de la exportación a Parquet
+PARQUET_EXPORT_DIR = os.getenv("PARQUET_EXPORT_DIR", "analytics")
+PARQUET_BATCH_SIZE = int(os.getenv("PARQUET_BATCH_SIZE", "50000"))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+PARQUET_SAFETY_MARGIN = float(os.getenv("PARQUET_SAFETY_MARGIN", "300"))
+
+STATE_FILE = "_state.json"
+
+def _chat_messages_statement(after_id=None, limit=None):
+    # Solo metadatos: el texto de los mensajes no sale de la base
+    statement = select(
+        ChatMessage.id,
+        ChatMessage.room_id,
+        ChatMessage.user_id,
+        ChatMessage.username,
+        ChatMessage.is_admin,
+        func.length(ChatMessage.message, type_=Integer).label("message_length"),
+        ChatMessage.created_at
+    )
+    if after_id:
+        statement = statement.where(ChatMessage.id > after_id)
+    statement = statement.order_by(ChatMessage.id)
+    if limit:
+        statement = statement.limit(limit)
+    return statement
+
+# Tabla exportada -> consulta paginada por id
+PARQUET_TABLES = {
+    "game_interactions": lambda after_id, limit: entity_export_statement("game_interactions", after_id=after_id, limit=limit),
+    "promo_interactions": lambda after_id, limit: entity_export_statement("promo_interactions", after_id=after_id, limit=limit),
+    "contacts": lambda after_id, limit: entity_export_statement("contacts", after_id=after_id, limit=limit),
+    "chat_messages": _chat_messages_statement
+}
+
+# Tablas con filas que cambian o se borran: se exporta una foto completa
+PARQUET_SNAPSHOT_TABLES = {"contacts"}
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow is required for Parquet exports: pip install pyarrow")
+    return pyarrow
+
+def _arrow_schema(pa, statement):
+    """Esquema fijo a partir de los tipos de la consulta, igual en todos los archivos"""
+    fields = []
+    for column in statement.selected_columns:
+        python_type = column.type.python_type
+        if python_type is bool:
+            arrow_type = pa.bool_()
+        elif python_type is int:
+            arrow_type = pa.int64()
+        elif python_type is datetime:
+            arrow_type = pa.timestamp("us", tz="UTC")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+def _as_utc(value):
+    # SQLite devuelve fechas sin zona horaria; se guardan en UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def load_state(output):
+    path = os.path.join(output, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_state(output, state):
+    # Escritura atómica: un corte a mitad no deja el estado roto
+    path = os.path.join(output, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def _arrow_table(pa, schema, rows):
+    columns = {
+        name: [_as_utc(row[name]) if isinstance(row[name], datetime) else row[name] for row in rows]
+        for name in schema.names
+    }
+    return pa.table(columns, schema=schema)
+
+def _fetch(statement):
+    db = read_router.session()
+    try:
+        return db.execute(statement).mappings().all()
+    finally:
+        db.close()
+
+def _write_partitions(pa, output, table, schema, rows, compression):
+    by_day = defaultdict(list)
+    for row in rows:
+        created_at = row["created_at"]
+        by_day[created_at.date().isoformat() if created_at else "unknown"].append(row)
+
+    for day, day_rows in by_day.items():
+        directory = os.path.join(output, table, f"date={day}")
+        os.makedirs(directory, exist_ok=True)
+        # El nombre depende solo de los ids: repetir un lote lo sobrescribe en vez de duplicarlo
+        path = os.path.join(directory, f"part-{day_rows[0]['id']:010d}-{day_rows[-1]['id']:010d}.parquet")
+        pa.parquet.write_table(_arrow_table(pa, schema, day_rows), path + ".tmp", compression=compression)
+        os.replace(path + ".tmp", path)
+    return len(by_day)
+
+def _settled_rows(rows, cutoff):
+    """Cortar el lote en la primera fila más nueva que el margen de seguridad"""
+    for index, row in enumerate(rows):
+        created_at = _as_utc(row["created_at"])
+        if created_at is not None and created_at >= cutoff:
+            return rows[:index], True
+    return rows, False
+
+def export_snapshot(table, output, batch_size=PARQUET_BATCH_SIZE, compression=PARQUET_COMPRESSION):
+    """Reescribir la tabla entera en un solo archivo, un lote en memoria a la vez"""
+    pa = _require_pyarrow()
+    build_statement = PARQUET_TABLES[table]
+    schema = _arrow_schema(pa, build_statement(None, None))
+    directory = os.path.join(output, table)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "snapshot.parquet")
+    last_id = 0
+    exported = 0
+
+    writer = pa.parquet.ParquetWriter(path + ".tmp", schema, compression=compression)
+    try:
+        while True:
+            rows = _fetch(build_statement(last_id, batch_size))
+            if not rows:
+                break
+            writer.write_table(_arrow_table(pa, schema, rows))
+            last_id = rows[-1]["id"]
+            exported += len(rows)
+    finally:
+        writer.close()
+    # La foto anterior sigue completa hasta que la nueva termina de escribirse
+    os.replace(path + ".tmp", path)
+
+    log.info("Parquet %s: foto de %s filas", table, exported)
+    return {"rows": exported, "files": 1, "last_id": last_id}
+
+def export_table(table, output, batch_size=PARQUET_BATCH_SIZE, compression=PARQUET_COMPRESSION,
+                 safety_margin=PARQUET_SAFETY_MARGIN):
+    """Exportar las filas posteriores al último id guardado, un lote en memoria a la vez"""
+    if table in PARQUET_SNAPSHOT_TABLES:
+        return export_snapshot(table, output, batch_size, compression)
+
+    pa = _require_pyarrow()
+    build_statement = PARQUET_TABLES[table]
+    schema = _arrow_schema(pa, build_statement(None, None))
+    state = load_state(output)
+    last_id = state.get(table, 0)
+    exported = 0
+    files = 0
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=safety_margin)
+
+    while True:
+        rows, reached_cutoff = _settled_rows(_fetch(build_statement(last_id, batch_size)), cutoff)
+        if rows:
+            files += _write_partitions(pa, output, table, schema, rows, compression)
+            last_id = rows[-1]["id"]
+            exported += len(rows)
+            # El estado avanza después de escribir los archivos del lote
+            state[table] = last_id
+            save_state(output, state)
+        if reached_cutoff or len(rows) < batch_size:
+            break
+
+    if exported:
+        log.info("Parquet %s: %s filas en %s archivos, último id %s", table, exported, files, last_id)
+    return {"rows": exported, "files": files, "last_id": last_id}
+
+def export_all(output=PARQUET_EXPORT_DIR, tables=None, batch_size=PARQUET_BATCH_SIZE, compression=PARQUET_COMPRESSION,
+               safety_margin=PARQUET_SAFETY_MARGIN):
+    os.makedirs(output, exist_ok=True)
+    return {
+        table: export_table(table, output, batch_size, compression, safety_margin)
+        for table in (tables or PARQUET_TABLES)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export analytics tables to date-partitioned Parquet files")
+    parser.add_argument("--output", default=PARQUET_EXPORT_DIR, help="output directory")
+    parser.add_argument("--tables", default=",".join(PARQUET_TABLES), help="comma separated tables")
+    parser.add_argument("--batch-size", type=int, default=PARQUET_BATCH_SIZE, help="rows read per query")
+    parser.add_argument("--compression", default=PARQUET_COMPRESSION, help="snappy, zstd, gzip or none")
+    parser.add_argument("--safety-margin", type=float, default=PARQUET_SAFETY_MARGIN,
+                        help="only export rows created at least this many seconds ago")
+    args = parser.parse_args(argv)
+
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    unknown = [t for t in tables if t not in PARQUET_TABLES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+
+    try:
+        _require_pyarrow()
+    except RuntimeError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    results = export_all(args.output, tables, args.batch_size, args.compression, args.safety_margin)
+    for table, result in results.items():
+        if table in PARQUET_SNAPSHOT_TABLES:
+            print(f"✅ {table}: foto completa de {result['rows']} filas")
+        else:
+            print(f"✅ {table}: {result['rows']} filas nuevas en {result['files']} archivos (último id {result['last_id']})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import Session
+
+from database import pwd_context, SessionLocal, User
+from logs import get_logger
+from metrics import registry, Counter, Gauge
+
+log = get_logger("auth")
+
+# Configuración del pool de hashing (bcrypt libera el GIL mientras calcula)
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", "2"))
+PASSWORD_POOL_MAX_PENDING = int(os.getenv("PASSWORD_POOL_MAX_PENDING", "32"))
+
+class PasswordPoolBusy(Exception):
+    """Demasiadas operaciones de contraseña en cola"""
+
+class PasswordPool:
+    """Pool acotado de hilos para hashear y verificar contraseñas fuera del event loop"""
+
+    def __init__(self, workers, max_pending):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._workers = workers
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            "completed": 0,
+            "rejected": 0,
+            "queue_seconds_total": 0.0,
+            "queue_seconds_max": 0.0,
+            "run_seconds_total": 0.0
+        }
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=self._pending, workers=self._workers)
+
+    def _record(self, queued, ran):
+        with self._lock:
+            self._stats["completed"] += 1
+            self._stats["queue_seconds_total"] += queued
+            self._stats["queue_seconds_max"] = max(self._stats["queue_seconds_max"], queued)
+            self._stats["run_seconds_total"] += ran
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._pending >= self._max_pending:
+                self._stats["rejected"] += 1
+                raise PasswordPoolBusy()
+            self._pending += 1
+
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self._record(started - submitted, time.perf_counter() - started)
+
+        try:
+            future = self._executor.submit(task)
+        except Exception:
+            self._done()
+            raise
+        # Se descuenta cuando el hilo termina, no cuando se cancela la petición que espera
+        future.add_done_callback(lambda _: self._done())
+        return await asyncio.wrap_future(future)
+
+    def _done(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def hash(self, password):
+        return await self.run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password, hashed_password):
+        return await self.run(pwd_context.verify_and_update, password, hashed_password)
+
+password_pool = PasswordPool(PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_PENDING)
+
+registry.register(Gauge(
+    "password_pool_pending", "Operaciones de contraseña en cola o en ejecución",
+    callback=lambda: password_pool.stats()["pending"]))
+registry.register(Counter(
+    "password_pool_completed_total", "Operaciones de contraseña completadas",
+    callback=lambda: password_pool.stats()["completed"]))
+registry.register(Counter(
+    "password_pool_rejected_total", "Operaciones rechazadas por cola llena",
+    callback=lambda: password_pool.stats()["rejected"]))
+registry.register(Counter(
+    "password_pool_queue_seconds_total", "Tiempo total de espera en cola",
+    callback=lambda: password_pool.stats()["queue_seconds_total"]))
+registry.register(Gauge(
+    "password_pool_queue_seconds_max", "Máxima espera en cola observada",
+    callback=lambda: password_pool.stats()["queue_seconds_max"]))
+
+async def authenticate_user_async(db: Session, username: str, password: str):
+    """Autenticar al usuario con bcrypt ejecutado en el pool"""
+    user = db.query(User).filter(User.username == username).first()
+    if not user:
+        return False
+    valid, new_hash = await password_pool.verify_and_update(password, user.hashed_password)
+    if not valid:
+        return False
+    # Rehashear con el costo configurado si el hash guardado usa otro
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
+    return user
+
+async def get_password_hash(password):
+    """Hash bcrypt calculado en el pool"""
+    return await password_pool.hash(password)
+
+async def ensure_admin_user():
+    """Crear el usuario admin por defecto si no existe"""
+    db = SessionLocal()
+    try:
+        if db.query(User.id).filter(User.username == "admin").first():
+            return
+        admin_user = User(
+            username="admin",
+            email="admin@aresclub.com",
+            hashed_password=await get_password_hash("admin123"),
+            is_admin=True
+        )
+        db.add(admin_user)
+        db.commit()
+        log.info("Usuario admin creado")
+    except Exception as e:
+        db.rollback()
+        log.error("Error creando admin: %s", e)
+    finally:
+        db.close()
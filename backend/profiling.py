@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs
+
+from starlette.routing import Match
+
+from logs import get_logger
+
+log = get_logger("profiling")
+
+# Configuración del profiler por petición
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "64"))
+# Muestreo continuo por ruta, por ejemplo "/api/stats=0.01,/api/chat/rooms=0.05"
+PROFILE_SAMPLE_ROUTES = os.getenv("PROFILE_SAMPLE_ROUTES", "")
+
+PROFILE_NAME = re.compile(r"^[0-9]+-[0-9a-f]{8}$")
+
+class SamplingProfiler:
+    """Toma muestras periódicas de la pila de un hilo desde un hilo aparte"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            parts = []
+            while frame is not None and len(parts) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(parts))] += 1
+            self.samples += 1
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+class ProfileStore:
+    """Perfiles guardados en disco, se conservan solo los más recientes"""
+
+    def __init__(self, directory, max_files):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def save(self, name, profile):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(name), "w") as f:
+                json.dump(profile, f)
+            files = sorted(f for f in os.listdir(self.directory) if f.endswith(".json"))
+            for old in files[:max(len(files) - self.max_files, 0)]:
+                os.remove(os.path.join(self.directory, old))
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for filename in sorted(os.listdir(self.directory), reverse=True):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                continue
+            profile.pop("stacks", None)
+            profiles.append(profile)
+        return profiles
+
+    def load(self, name):
+        if not PROFILE_NAME.match(name):
+            return None
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+
+def _parse_sample_routes(value):
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            route, rate = item.rsplit("=", 1)
+            rates[route.strip()] = float(rate)
+    return rates
+
+# Fracción de peticiones perfiladas por plantilla de ruta (modificable en caliente)
+sample_rates = _parse_sample_routes(PROFILE_SAMPLE_ROUTES)
+
+def collapsed_stacks(profile):
+    """Formato de pilas colapsadas, compatible con flamegraph.pl y speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in profile.get("stacks", {}).items())
+
+class ProfilingMiddleware:
+    """Perfila peticiones pedidas por un admin (X-Profile: 1 o ?__profile=1) o muestreadas por ruta"""
+
+    def __init__(self, app, is_admin_token):
+        self.app = app
+        self.is_admin_token = is_admin_token
+
+    def _route_template(self, scope):
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", None)
+        return None
+
+    async def _requested(self, scope):
+        headers = dict(scope.get("headers") or [])
+        flag = headers.get(b"x-profile") == b"1" or \
+            parse_qs(scope.get("query_string", b"").decode()).get("__profile") == ["1"]
+        if not flag:
+            return False
+        authorization = headers.get(b"authorization", b"").decode()
+        if not authorization.lower().startswith("bearer "):
+            return False
+        return await self.is_admin_token(authorization[7:])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route_template(scope) if sample_rates else None
+        sampled = route in sample_rates and random.random() < sample_rates[route]
+        if not sampled and not await self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", name.encode())]
+            await send(message)
+
+        # Los handlers async corren en el hilo del event loop; si hay otras
+        # peticiones concurrentes, sus pilas también aparecen en el perfil
+        profiler = SamplingProfiler(threading.get_ident()).start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            profile = {
+                "id": name,
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "route": route or self._route_template(scope),
+                "status": status[0],
+                "sampled": sampled,
+                "duration_seconds": round(profiler.duration, 6),
+                "interval_seconds": profiler.interval,
+                "samples": profiler.samples,
+                "created_at": time.time(),
+                "stacks": dict(profiler.stacks)
+            }
+            try:
+                await asyncio.to_thread(profile_store.save, name, profile)
+            except OSError as e:
+                log.error("Error guardando perfil %s: %s", name, e)
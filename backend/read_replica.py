@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionLocal, create_database_engine
+from logs import get_logger
+from metrics import registry, Counter, Gauge, instrument_engine
+
+log = get_logger("db")
+
+# Configuración de la réplica de lectura
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+READ_REPLICA_MAX_LAG = float(os.getenv("READ_REPLICA_MAX_LAG", "5"))
+READ_REPLICA_CHECK_INTERVAL = float(os.getenv("READ_REPLICA_CHECK_INTERVAL", "5"))
+
+# Segundos de atraso de la réplica; 0 si no es una réplica o si aplicó todo lo recibido
+# mientras sigue recibiendo. NULL si el WAL receiver no está en streaming: la réplica
+# aplica lo que tenía y se queda atrás sin que el atraso medido crezca
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+READ_SESSIONS = registry.register(Counter(
+    "db_read_sessions_total", "Sesiones de lectura por destino", ("target",)))
+
+class ReadRouter:
+    """Sesiones de solo lectura en la réplica mientras esté al día; si no, en la primaria"""
+
+    def __init__(self, url=DATABASE_READ_URL, max_lag=READ_REPLICA_MAX_LAG, check_interval=READ_REPLICA_CHECK_INTERVAL):
+        self.engine = create_database_engine(url) if url else None
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag = None
+        self._session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine) if self.engine else None
+        self._healthy = None  # Sin medir todavía
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _measure_lag(self):
+        with self.engine.connect() as conn:
+            if self.engine.dialect.name != "postgresql":
+                conn.execute(text("SELECT 1"))
+                return 0.0
+            lag = conn.execute(REPLICA_LAG_QUERY).scalar()
+            return float(lag) if lag is not None else None
+
+    def _set_health(self, healthy, lag, reason=None):
+        if healthy != self._healthy:
+            if healthy:
+                log.info("Réplica de lectura disponible (atraso %.1fs)", lag)
+            else:
+                log.warning("Lecturas desviadas a la primaria: %s", reason)
+        self._healthy = healthy
+        self.lag = lag
+
+    def available(self):
+        """Estado de la réplica, medido como mucho una vez cada check_interval"""
+        if self.engine is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return bool(self._healthy)
+            # Un solo hilo mide; el resto usa el último estado conocido
+            self._checked_at = now
+
+        try:
+            lag = self._measure_lag()
+        except Exception as e:
+            self._set_health(False, None, f"réplica no disponible ({e})")
+            return False
+        if lag is None:
+            self._set_health(False, None, "la réplica no recibe WAL de la primaria")
+        elif lag > self.max_lag:
+            self._set_health(False, lag, f"atraso de {lag:.1f}s mayor a {self.max_lag}s")
+        else:
+            self._set_health(True, lag)
+        return self._healthy
+
+    def session(self):
+        """Sesión para consultas que toleran datos con hasta max_lag segundos de atraso"""
+        if self.available():
+            db = self._session()
+            try:
+                # Abrir la conexión ya: si la réplica cayó se usa la primaria
+                db.connection()
+                READ_SESSIONS.inc("replica")
+                return db
+            except DBAPIError as e:
+                db.close()
+                self._set_health(False, None, f"réplica no disponible ({e})")
+        READ_SESSIONS.inc("primary")
+        return SessionLocal()
+
+read_router = ReadRouter()
+
+if read_router.engine is not None:
+    instrument_engine(read_router.engine, "db_read")
+    registry.register(Gauge(
+        "db_replica_lag_seconds", "Último atraso medido de la réplica de lectura",
+        callback=lambda: read_router.lag or 0))
+
+def get_read_db():
+    """Dependencia de FastAPI para endpoints de solo lectura"""
+    db = read_router.session()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_
+
+from database import SessionLocal, RefreshToken, User
+
+# Configuración de los refresh tokens
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+REFRESH_TOKEN_CLEANUP_INTERVAL = int(os.getenv("REFRESH_TOKEN_CLEANUP_INTERVAL", str(24 * 3600)))
+
+class InvalidRefreshToken(Exception):
+    """Refresh token inexistente, vencido o revocado"""
+
+def _hash_token(raw_token):
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+def _utc_naive(value):
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _add_refresh_token(db, user, family_id=None):
+    raw_token = secrets.token_urlsafe(48)
+    token = RefreshToken(
+        token_hash=_hash_token(raw_token),
+        user_id=user.id,
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    db.add(token)
+    db.flush()
+    return raw_token, token
+
+def issue_refresh_token(db, user, family_id=None):
+    """Crear un refresh token opaco; en la base solo se guarda su hash"""
+    raw_token, token = _add_refresh_token(db, user, family_id)
+    db.commit()
+    return raw_token, token
+
+def _revoke_family(db, family_id):
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+def rotate_refresh_token(db, raw_token):
+    """Canjear un refresh token por uno nuevo de la misma familia"""
+    token = db.query(RefreshToken).filter(RefreshToken.token_hash == _hash_token(raw_token)).first()
+    if not token:
+        raise InvalidRefreshToken("Invalid refresh token")
+
+    # Reusar un token ya rotado indica robo: se revoca toda la sesión
+    if token.revoked_at is not None:
+        _revoke_family(db, token.family_id)
+        raise InvalidRefreshToken("Refresh token reused")
+
+    if _utc_naive(token.expires_at) <= datetime.utcnow():
+        raise InvalidRefreshToken("Refresh token expired")
+
+    user = db.get(User, token.user_id)
+    if not user or user.is_active is False:
+        _revoke_family(db, token.family_id)
+        raise InvalidRefreshToken("User not found")
+
+    # Revocar antes de emitir y solo si sigue vigente: de dos canjes simultáneos
+    # del mismo token uno solo gana, el otro cuenta como reuso
+    revoked = db.query(RefreshToken).filter(
+        RefreshToken.id == token.id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    if not revoked:
+        db.rollback()
+        _revoke_family(db, token.family_id)
+        raise InvalidRefreshToken("Refresh token reused")
+
+    # El sucesor se crea en la misma transacción que la revocación
+    new_raw_token, new_token = _add_refresh_token(db, user, family_id=token.family_id)
+    db.query(RefreshToken).filter(RefreshToken.id == token.id).update(
+        {RefreshToken.replaced_by_id: new_token.id}, synchronize_session=False
+    )
+    db.commit()
+    return user, new_raw_token
+
+def revoke_refresh_token(db, raw_token):
+    """Cerrar la sesión asociada a un refresh token"""
+    token = db.query(RefreshToken).filter(RefreshToken.token_hash == _hash_token(raw_token)).first()
+    if not token:
+        return False
+    _revoke_family(db, token.family_id)
+    return True
+
+def cleanup_refresh_tokens():
+    """Tarea periódica: borrar tokens vencidos o revocados hace tiempo"""
+    cutoff = datetime.utcnow() - timedelta(days=1)
+    db = SessionLocal()
+    try:
+        deleted = db.query(RefreshToken).filter(or_(
+            RefreshToken.expires_at < cutoff,
+            RefreshToken.revoked_at < cutoff
+        )).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+
+import jobs
+from logs import get_logger
+from metrics import registry, Counter, Histogram
+
+log = get_logger("stats")
+
+# Configuración de la caché de /api/stats
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "10"))
+STATS_CACHE_STALE_TTL = float(os.getenv("STATS_CACHE_STALE_TTL", "60"))
+
+CACHE_REQUESTS = registry.register(Counter(
+    "response_cache_requests_total", "Lecturas de caché por resultado (hit, stale, miss)", ("cache", "result")))
+CACHE_REFRESH = registry.register(Histogram(
+    "response_cache_refresh_seconds", "Duración de cada recálculo de la caché", ("cache",)))
+CACHE_REFRESH_ERRORS = registry.register(Counter(
+    "response_cache_refresh_errors_total", "Recálculos de la caché que fallaron", ("cache",)))
+
+class StaleWhileRevalidateCache:
+    """Un valor calculado en un hilo, con TTL y recálculo único en segundo plano
+
+    Dentro de `ttl` se devuelve el valor guardado. Hasta `ttl + stale_ttl` se
+    devuelve igual y se lanza un recálculo; después se espera uno nuevo. Nunca
+    corre más de un recálculo a la vez: los demás llamadores esperan ese mismo.
+    """
+
+    def __init__(self, name, compute, ttl, stale_ttl):
+        self.name = name
+        self.compute = compute
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._value = None
+        self._updated_at = None
+        self._refresh = None
+
+    def _run_compute(self):
+        start = time.perf_counter()
+        try:
+            return self.compute()
+        finally:
+            CACHE_REFRESH.observe(time.perf_counter() - start, self.name)
+
+    def _on_refresh_done(self, task):
+        self._refresh = None
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            CACHE_REFRESH_ERRORS.inc(self.name)
+            log.error("Error recalculando caché %s: %s", self.name, error)
+            return
+        self._value = task.result()
+        self._updated_at = time.monotonic()
+
+    def _start_refresh(self):
+        # Todo corre en el event loop: no hace falta lock para el recálculo en curso
+        if self._refresh is None:
+            self._refresh = jobs.spawn(self._run_compute)
+            self._refresh.add_done_callback(self._on_refresh_done)
+        return self._refresh
+
+    async def get(self):
+        age = time.monotonic() - self._updated_at if self._updated_at is not None else None
+        if age is not None and age < self.ttl:
+            CACHE_REQUESTS.inc(self.name, "hit")
+            return self._value
+        if age is not None and age < self.ttl + self.stale_ttl:
+            CACHE_REQUESTS.inc(self.name, "stale")
+            self._start_refresh()
+            return self._value
+
+        CACHE_REQUESTS.inc(self.name, "miss")
+        # shield: si el cliente corta, el recálculo sigue para los demás
+        return await asyncio.shield(self._start_refresh())
+
+    def clear(self):
+        self._value = None
+        self._updated_at = None
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine, SessionLocal, InteractionDailyStat
+from dimensions import INTERACTION_SOURCES, entity_names
+from logs import get_logger
+
+log = get_logger("retention")
+
+# Configuración de la retención de interacciones
+INTERACTION_RETENTION_DAYS = int(os.getenv("INTERACTION_RETENTION_DAYS", "90"))
+INTERACTION_RETENTION_BATCH_SIZE = int(os.getenv("INTERACTION_RETENTION_BATCH_SIZE", "5000"))
+INTERACTION_RETENTION_PAUSE = float(os.getenv("INTERACTION_RETENTION_PAUSE", "0.05"))
+INTERACTION_RETENTION_INTERVAL = int(os.getenv("INTERACTION_RETENTION_INTERVAL", str(24 * 3600)))
+
+# Bytes aproximados por fila además del texto: cabecera, id, fecha e índices
+RAW_ROW_OVERHEAD_BYTES = 64
+AGGREGATE_ROW_BYTES = 120
+
+# Clave del advisory lock de PostgreSQL que comparten todos los workers
+RETENTION_LOCK_KEY = 4307
+_compaction_running = threading.Lock()
+
+def retention_cutoff(days=INTERACTION_RETENTION_DAYS):
+    """Inicio del primer día que se conserva completo"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days)
+
+def _utc_day(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date().isoformat()
+
+def _interaction_type(model):
+    return func.coalesce(model.interaction_type, "click")
+
+def _insert_statement():
+    return postgresql.insert(InteractionDailyStat) if engine.dialect.name == "postgresql" else sqlite.insert(InteractionDailyStat)
+
+def _add_to_aggregates(db, kind, counts):
+    """Sumar conteos a los agregados con un upsert: dos corridas nunca chocan en la clave única"""
+    rows = [
+        {"kind": kind, "name": name, "interaction_type": interaction_type, "day": day, "count": count}
+        for (name, interaction_type, day), count in counts.items()
+    ]
+    statement = _insert_statement()
+    db.execute(statement.values(rows).on_conflict_do_update(
+        index_elements=["kind", "name", "interaction_type", "day"],
+        set_={"count": InteractionDailyStat.count + statement.excluded.count}
+    ))
+
+def compact_interactions(kind, cutoff, batch_size=INTERACTION_RETENTION_BATCH_SIZE):
+    """Sumar las filas anteriores al corte en agregados diarios y borrarlas por lotes"""
+    source = INTERACTION_SOURCES[kind]
+    model = source.model
+    compacted = 0
+
+    db = SessionLocal()
+    try:
+        while True:
+            batch = select(model.id).where(model.created_at < cutoff).order_by(model.id).limit(batch_size)
+            # Solo se agregan las filas que borró esta transacción: si otra corrida
+            # ya las borró, RETURNING no las devuelve y no se cuentan dos veces
+            deleted = db.execute(
+                delete(model).where(model.id.in_(batch.scalar_subquery())).returning(
+                    source.name_id, source.legacy_name, model.interaction_type, model.created_at
+                ).execution_options(synchronize_session=False)
+            ).all()
+            if not deleted:
+                db.commit()
+                break
+
+            names = entity_names.values(db, [name_id for name_id, _, _, _ in deleted])
+            counts = Counter(
+                (names.get(name_id, legacy_name), interaction_type or "click", _utc_day(created_at))
+                for name_id, legacy_name, interaction_type, created_at in deleted
+            )
+            _add_to_aggregates(db, kind, counts)
+            db.commit()
+            compacted += len(deleted)
+
+            if INTERACTION_RETENTION_PAUSE:
+                time.sleep(INTERACTION_RETENTION_PAUSE)
+        return compacted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@contextmanager
+def _compaction_lock():
+    """Una sola compactación a la vez: en el proceso y, en PostgreSQL, entre workers"""
+    if not _compaction_running.acquire(blocking=False):
+        yield False
+        return
+    try:
+        if engine.dialect.name != "postgresql":
+            yield True
+            return
+        with engine.connect() as conn:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RETENTION_LOCK_KEY}).scalar()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RETENTION_LOCK_KEY})
+    finally:
+        _compaction_running.release()
+
+def run_interaction_retention(days=INTERACTION_RETENTION_DAYS):
+    """Tarea periódica: compactar las interacciones más antiguas que la ventana"""
+    if days <= 0:
+        return {}
+    with _compaction_lock() as acquired:
+        if not acquired:
+            log.info("Compactación de interacciones ya en curso, se omite esta corrida")
+            return {}
+        cutoff = retention_cutoff(days)
+        compacted = {kind: compact_interactions(kind, cutoff) for kind in INTERACTION_SOURCES}
+    if any(compacted.values()):
+        log.info("Interacciones compactadas anteriores a %s: %s", cutoff.date().isoformat(), compacted)
+    return compacted
+
+def retention_report(days=INTERACTION_RETENTION_DAYS):
+    """Simulación: cuántas filas se compactarían y cuánto espacio se liberaría (estimado)"""
+    cutoff = retention_cutoff(days)
+    tables = {}
+
+    db = SessionLocal()
+    try:
+        for kind, source in INTERACTION_SOURCES.items():
+            model = source.model
+            old = model.created_at < cutoff
+            # Solo el texto guardado en la propia fila; las dimensiones no se borran
+            rows, text_bytes, oldest = db.query(
+                func.count(model.id),
+                func.sum(
+                    func.coalesce(func.length(model.user_agent), 0) +
+                    func.coalesce(func.length(model.ip_address), 0) +
+                    func.coalesce(func.length(source.legacy_name), 0) +
+                    func.coalesce(func.length(model.interaction_type), 0)
+                ),
+                func.min(model.created_at)
+            ).filter(old).one()
+
+            groups = db.query(
+                source.name, _interaction_type(model), func.date(model.created_at)
+            ).select_from(source.from_clause).filter(old).distinct().subquery()
+            aggregate_rows = db.query(func.count()).select_from(groups).scalar() or 0
+
+            raw_bytes = int(text_bytes or 0) + rows * RAW_ROW_OVERHEAD_BYTES
+            tables[model.__tablename__] = {
+                "rows_to_compact": rows,
+                "aggregate_rows": aggregate_rows,
+                "oldest_row_at": oldest.isoformat() if oldest else None,
+                "estimated_bytes_reclaimed": max(raw_bytes - aggregate_rows * AGGREGATE_ROW_BYTES, 0)
+            }
+    finally:
+        db.close()
+
+    return {
+        "retention_days": days,
+        "cutoff": cutoff.date().isoformat(),
+        "tables": tables,
+        "estimated_bytes_reclaimed": sum(t["estimated_bytes_reclaimed"] for t in tables.values())
+    }
+
+def aggregated_total(db, kind):
+    """Interacciones ya compactadas de un tipo"""
+    return db.query(func.coalesce(func.sum(InteractionDailyStat.count), 0)).filter(
+        InteractionDailyStat.kind == kind
+    ).scalar()
+
+def aggregated_by_name(db, kind):
+    """Interacciones compactadas agrupadas por juego o promoción"""
+    return dict(db.query(InteractionDailyStat.name, func.sum(InteractionDailyStat.count)).filter(
+        InteractionDailyStat.kind == kind
+    ).group_by(InteractionDailyStat.name).all())
@@ -1,24 +1,53 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, text, func
 import os
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, date
 from typing import Optional
 import jwt
 from datetime import timedelta
 import socketio
 import hashlib
+import math
+import asyncio
 
-from database import get_db, create_tables, check_db_connection, Contact, GameInteraction, PromoInteraction, User, ChatMessage, ChatRoom, authenticate_user, SessionLocal
+from database import get_db, create_tables, check_db_connection, Contact, GameInteraction, PromoInteraction, User, ChatMessage, ChatRoom, ChatRoomDeletion, SessionLocal, engine
+from read_replica import get_read_db, read_router
+from response_cache import StaleWhileRevalidateCache, STATS_CACHE_TTL, STATS_CACHE_STALE_TTL
+from auth_cache import token_cache, principal_cache
+from refresh_tokens import issue_refresh_token, rotate_refresh_token, revoke_refresh_token, cleanup_refresh_tokens, InvalidRefreshToken, REFRESH_TOKEN_CLEANUP_INTERVAL
+from login_throttle import login_throttle, LoginThrottleBusy
+from password_pool import authenticate_user_async, ensure_admin_user, PasswordPoolBusy
+from retention import run_interaction_retention, retention_report, aggregated_total, aggregated_by_name, INTERACTION_RETENTION_DAYS, INTERACTION_RETENTION_INTERVAL
+from trending import trending, TRENDING_WINDOWS
+from unique_visitors import unique_visitors, UNIQUE_VISITORS_FLUSH_INTERVAL, UNIQUE_VISITORS_MAX_DAYS
+from dimensions import interaction_values, interaction_counts_by_name, setup_interaction_dimensions, backfill_interaction_dimensions
+from contacts import upsert_contact, backfill_contact_keys
+from chat_deletion import request_room_deletion, purge_chat_room, pending_deletion_ids, deletion_to_dict
+from chat_search import setup_chat_search, search_chat_messages, SearchUnavailable
+from exports import stream_chat_export, stream_entity_export, EXPORT_FORMATS, EXPORT_ENTITIES
+from chat_partitions import setup_chat_partitions, run_chat_maintenance, load_archived_messages, list_archived_periods, CHAT_MAINTENANCE_INTERVAL
+import jobs
+import metrics
+from logs import setup_logging, get_logger
+from profiling import ProfilingMiddleware, profile_store, sample_rates, collapsed_stacks
+from loop_monitor import loop_monitor
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Logs estructurados escritos desde un hilo aparte
+setup_logging()
+log = get_logger("api")
+auth_log = get_logger("auth")
+chat_log = get_logger("chat")
+socket_log = get_logger("socket")
+
 app = FastAPI(title="Ares Club Casino API", version="1.0.0")
 
 # Configuración JWT
@@ -30,8 +59,8 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 sio = socketio.AsyncServer(
     async_mode='asgi',
     cors_allowed_origins="*",
-    logger=True,
-    engineio_logger=True
+    logger=get_logger("socketio"),
+    engineio_logger=get_logger("engineio")
 )
 
 # Crear la aplicación ASGI con Socket.IO
@@ -49,6 +78,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas de HTTP y base de datos
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+
 # Montar archivos estáticos
 if os.path.isdir("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -56,13 +89,32 @@ if os.path.isdir("static"):
 # Crear tablas al iniciar
 @app.on_event("startup")
 async def startup_event():
-    print("🚀 Iniciando Ares Club Casino API...")
+    log.info("Iniciando Ares Club Casino API...")
+    loop_monitor.start()
     if check_db_connection():
-        print("✅ Conexión a PostgreSQL exitosa")
+        log.info("Conexión a la base de datos exitosa")
         create_tables()
-        print("✅ Tablas creadas/verificadas")
+        log.info("Tablas creadas/verificadas")
+        await ensure_admin_user()
+        setup_chat_partitions()
+        setup_chat_search()
+        setup_interaction_dimensions()
+        jobs.spawn(backfill_interaction_dimensions)
+        jobs.spawn(backfill_contact_keys)
+        jobs.spawn(unique_visitors.backfill_monthly)
+        for job_id in pending_deletion_ids():
+            jobs.spawn(purge_chat_room, job_id)
+        jobs.schedule("chat_maintenance", CHAT_MAINTENANCE_INTERVAL, run_chat_maintenance, initial_delay=60)
+        jobs.schedule("refresh_token_cleanup", REFRESH_TOKEN_CLEANUP_INTERVAL, cleanup_refresh_tokens, initial_delay=120)
+        jobs.schedule("unique_visitors_flush", UNIQUE_VISITORS_FLUSH_INTERVAL, unique_visitors.flush, initial_delay=UNIQUE_VISITORS_FLUSH_INTERVAL)
+        jobs.schedule("interaction_retention", INTERACTION_RETENTION_INTERVAL, run_interaction_retention, initial_delay=300)
     else:
-        print("❌ Error conectando a PostgreSQL")
+        log.error("Error conectando a la base de datos")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # No perder los visitantes únicos acumulados en memoria
+    await asyncio.to_thread(unique_visitors.flush)
 
 # Juegos disponibles
 GAMES = [
@@ -143,6 +195,16 @@ PAYMENT_METHODS = [
     {"name": "E-Wallets", "type": "ewallet", "icon": "📱", "image": "https://images.pexels.com/photos/4386321/pexels-photo-4386321.jpeg?auto=compress&cs=tinysrgb&w=200"}
 ]
 
+# Búsquedas en el catálogo
+def find_game(game_id):
+    return next((g for g in GAMES if g["id"] == game_id), None)
+
+def find_promotion(promo_id):
+    return next((p for p in PROMOTIONS if p["id"] == promo_id), None)
+
+def active_promotions():
+    return [p for p in PROMOTIONS if p.get("active", True)]
+
 # Funciones de autenticación
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -158,24 +220,77 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         if not credentials or not credentials.credentials:
             raise HTTPException(status_code=401, detail="No token provided")
+        # Los tokens ya verificados se resuelven sin volver a comprobar la firma
+        username = token_cache.get(credentials.credentials)
+        if username is not None:
+            return username
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        print(f"Token verificado para usuario: {username}")
+        token_cache.put(credentials.credentials, username, payload.get("exp"))
+        auth_log.debug("Token verificado para usuario: %s", username)
         return username
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.PyJWTError as e:
-        print(f"Error verificando token: {e}")
+        auth_log.info("Error verificando token: %s", e)
         raise HTTPException(status_code=401, detail="Invalid token")
 
 def get_current_user(db: Session = Depends(get_db), username: str = Depends(verify_token)):
-    user = db.query(User).filter(User.username == username).first()
+    user = principal_cache.get(username)
     if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
+        db_user = db.query(User).filter(User.username == username).first()
+        if db_user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        user = principal_cache.put(db_user)
+    if not user.is_active:
+        raise HTTPException(status_code=401, detail="Inactive user")
     return user
 
+def token_response(user, refresh_token):
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=access_token_expires
+    )
+    
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "user": {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "is_admin": user.is_admin
+        }
+    }
+
+def load_principal(username):
+    """Usuario autenticado desde la base, guardado en la caché; None si no existe"""
+    db = SessionLocal()
+    try:
+        db_user = db.query(User).filter(User.username == username).first()
+        return principal_cache.put(db_user) if db_user is not None else None
+    finally:
+        db.close()
+
+async def is_admin_token(token):
+    """Comprobar un token de admin fuera de las dependencias de FastAPI"""
+    try:
+        username = verify_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    except HTTPException:
+        return False
+    user = principal_cache.get(username)
+    if user is None:
+        # La consulta no corre en el event loop: cualquiera puede mandar X-Profile
+        user = await asyncio.to_thread(load_principal, username)
+    return user is not None and user.is_active and user.is_admin
+
+# Perfilado de peticiones a pedido de un admin
+app.add_middleware(ProfilingMiddleware, is_admin_token=is_admin_token)
+
 @app.get("/")
 async def root():
     return {
@@ -185,6 +300,13 @@ async def root():
         "status": "active"
     }
 
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """Métricas en formato de texto de Prometheus"""
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/health")
 async def health_check(db: Session = Depends(get_db)):
     """Verificar estado de la API y base de datos"""
@@ -210,20 +332,20 @@ async def get_games():
 @app.get("/api/games/{game_id}")
 async def get_game(game_id: int, db: Session = Depends(get_db)):
     """Obtener detalles de un juego específico"""
-    game = next((g for g in GAMES if g["id"] == game_id), None)
+    game = find_game(game_id)
     if not game:
         raise HTTPException(status_code=404, detail="Juego no encontrado")
     
     # Registrar interacción
     try:
         interaction = GameInteraction(
-            game_name=game["name"],
-            interaction_type="view"
+            interaction_type="view",
+            **interaction_values("game", game["name"])
         )
         db.add(interaction)
         db.commit()
     except Exception as e:
-        print(f"Error registrando interacción: {e}")
+        log.error("Error registrando interacción: %s", e)
     
     return {
         "success": True,
@@ -237,20 +359,20 @@ async def interact_with_game(
     db: Session = Depends(get_db)
 ):
     """Registrar interacción con un juego (Meta Pixel tracking)"""
-    game = next((g for g in GAMES if g["id"] == game_id), None)
+    game = find_game(game_id)
     if not game:
         raise HTTPException(status_code=404, detail="Juego no encontrado")
     
     try:
         # Registrar interacción en la base de datos
         interaction = GameInteraction(
-            game_name=game["name"],
             interaction_type="click",
-            user_agent=request.headers.get("user-agent"),
-            ip_address=request.client.host
+            **interaction_values("game", game["name"], request.headers.get("user-agent"), request.client.host)
         )
         db.add(interaction)
         db.commit()
+        unique_visitors.record("game", game["name"], request.client.host)
+        trending.record("game", game["name"])
         
         return {
             "success": True,
@@ -264,11 +386,11 @@ async def interact_with_game(
 @app.get("/api/promotions")
 async def get_promotions():
     """Obtener lista de promociones disponibles"""
-    active_promotions = [p for p in PROMOTIONS if p.get("active", True)]
+    promotions = active_promotions()
     return {
         "success": True,
-        "data": active_promotions,
-        "total": len(active_promotions)
+        "data": promotions,
+        "total": len(promotions)
     }
 
 @app.post("/api/promotions/{promo_id}/interact")
@@ -278,19 +400,19 @@ async def interact_with_promotion(
     db: Session = Depends(get_db)
 ):
     """Registrar interacción con una promoción"""
-    promo = next((p for p in PROMOTIONS if p["id"] == promo_id), None)
+    promo = find_promotion(promo_id)
     if not promo:
         raise HTTPException(status_code=404, detail="Promoción no encontrada")
     
     try:
         interaction = PromoInteraction(
-            promo_name=promo["title"],
             interaction_type="click",
-            user_agent=request.headers.get("user-agent"),
-            ip_address=request.client.host
+            **interaction_values("promo", promo["title"], request.headers.get("user-agent"), request.client.host)
         )
         db.add(interaction)
         db.commit()
+        unique_visitors.record("promo", promo["title"], request.client.host)
+        trending.record("promo", promo["title"])
         
         return {
             "success": True,
@@ -301,6 +423,22 @@ async def interact_with_promotion(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error registrando interacción: {str(e)}")
 
+@app.get("/api/trending")
+async def get_trending(kind: str = "game", window: str = "1h", limit: int = 5):
+    """Juegos o promociones con más clicks recientes (en memoria, sin consultar la base)"""
+    if kind not in ("game", "promo"):
+        raise HTTPException(status_code=400, detail="Kind must be game or promo")
+    if window not in TRENDING_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Window must be one of: {', '.join(TRENDING_WINDOWS)}")
+    
+    items = trending.top(kind, window, max(1, min(limit, 20)))
+    return {
+        "success": True,
+        "data": items,
+        "kind": kind,
+        "window": window
+    }
+
 @app.get("/api/payment-methods")
 async def get_payment_methods():
     """Obtener métodos de pago disponibles"""
@@ -318,16 +456,8 @@ async def contact_form(
 ):
     """Endpoint para formularios de contacto (Meta Pixel tracking)"""
     try:
-        # Registrar contacto en la base de datos
-        contact = Contact(
-            name=contact_data.get("name"),
-            phone=contact_data.get("phone"),
-            email=contact_data.get("email"),
-            message=contact_data.get("message", "Contacto desde landing page"),
-            source=contact_data.get("source", "whatsapp")
-        )
-        db.add(contact)
-        db.commit()
+        # Registrar contacto; si el teléfono o email ya existe se actualiza esa fila
+        upsert_contact(db, contact_data)
         
         return {
             "success": True,
@@ -384,35 +514,107 @@ async def get_faq():
         "total": len(faq_data)
     }
 
-@app.get("/api/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    """Obtener estadísticas básicas (para admin)"""
+def compute_stats():
+    """Conteos de contactos e interacciones y los juegos más clickeados"""
+    db = read_router.session()
     try:
         total_contacts = db.query(Contact).count()
-        total_game_interactions = db.query(GameInteraction).count()
-        total_promo_interactions = db.query(PromoInteraction).count()
+        # Las interacciones antiguas están compactadas en agregados diarios
+        total_game_interactions = db.query(GameInteraction).count() + aggregated_total(db, "game")
+        total_promo_interactions = db.query(PromoInteraction).count() + aggregated_total(db, "promo")
         
         # Top juegos más clickeados
-        top_games = db.query(GameInteraction.game_name, func.count(GameInteraction.id).label('clicks'))\
-                     .group_by(GameInteraction.game_name)\
-                     .order_by(desc('clicks'))\
-                     .limit(5).all()
+        game_clicks = aggregated_by_name(db, "game")
+        for name, clicks in interaction_counts_by_name(db, "game").items():
+            game_clicks[name] = game_clicks.get(name, 0) + clicks
+        top_games = sorted(game_clicks.items(), key=lambda game: game[1], reverse=True)[:5]
         
+        return {
+            "total_contacts": total_contacts,
+            "total_game_interactions": total_game_interactions,
+            "total_promo_interactions": total_promo_interactions,
+            "top_games": [{"name": game[0], "clicks": game[1]} for game in top_games]
+        }
+    finally:
+        db.close()
+
+stats_cache = StaleWhileRevalidateCache("stats", compute_stats, STATS_CACHE_TTL, STATS_CACHE_STALE_TTL)
+
+@app.get("/api/stats")
+async def get_stats():
+    """Obtener estadísticas básicas (para admin)"""
+    try:
+        # Con varios admins consultando a la vez se calcula una sola vez
+        stats = await stats_cache.get()
         return {
             "success": True,
-            "data": {
-                "total_contacts": total_contacts,
-                "total_game_interactions": total_game_interactions,
-                "total_promo_interactions": total_promo_interactions,
-                "top_games": [{"name": game[0], "clicks": game[1]} for game in top_games]
-            }
+            "data": stats
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
 
+@app.get("/api/stats/unique-visitors")
+async def get_unique_visitors(
+    kind: str = "game",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    name: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Visitantes únicos aproximados por juego o promoción en un rango de días"""
+    if kind not in ("game", "promo"):
+        raise HTTPException(status_code=400, detail="Kind must be game or promo")
+    
+    end = end or datetime.utcnow().date()
+    start = start or end
+    if start > end:
+        raise HTTPException(status_code=400, detail="Start must be before end")
+    if (end - start).days >= UNIQUE_VISITORS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range must be at most {UNIQUE_VISITORS_MAX_DAYS} days")
+    
+    # Combinar sketches es CPU pura: fuera del event loop
+    estimate = await asyncio.to_thread(unique_visitors.estimate, db, kind, start, end, name)
+    return {
+        "success": True,
+        "data": dict(estimate, kind=kind, start=start.isoformat(), end=end.isoformat())
+    }
+
+@app.get("/api/export/{entity}")
+async def export_entity(
+    entity: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    source: Optional[str] = None,
+    name: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    format: str = "csv",
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Exportar contactos o interacciones en bruto, ordenados por id (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can export data")
+    
+    if entity not in EXPORT_ENTITIES:
+        raise HTTPException(status_code=404, detail="Unknown export entity")
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    filename = f"{entity}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_entity_export(
+            entity, format, compress=gzip,
+            start=start, end=end, source=source, name=name, after_id=after_id, limit=limit
+        ),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # Endpoints de autenticación
 @app.post("/api/auth/login")
-async def login(login_data: dict, db: Session = Depends(get_db)):
+async def login(login_data: dict, request: Request, db: Session = Depends(get_db)):
     """Login de usuario"""
     username = login_data.get("username")
     password = login_data.get("password")
@@ -420,25 +622,53 @@ async def login(login_data: dict, db: Session = Depends(get_db)):
     if not username or not password:
         raise HTTPException(status_code=400, detail="Username and password required")
     
-    user = authenticate_user(db, username, password)
+    # Rechazar antes de consultar la base o calcular bcrypt
+    throttle_keys = login_throttle.keys_for(request.client.host if request.client else "unknown", username)
+    # El intento se reserva antes de bcrypt: una ráfaga en paralelo no prueba más contraseñas que el límite
+    try:
+        retry_after, attempt = await login_throttle.acquire(throttle_keys)
+    except LoginThrottleBusy:
+        raise HTTPException(status_code=503, detail="Too many login attempts, try again later", headers={"Retry-After": "1"})
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many failed login attempts", headers={"Retry-After": str(math.ceil(retry_after))})
+    
+    try:
+        user = await authenticate_user_async(db, username, password)
+    except PasswordPoolBusy:
+        login_throttle.release(throttle_keys, attempt)
+        raise HTTPException(status_code=503, detail="Too many login attempts, try again later", headers={"Retry-After": "1"})
+    except BaseException:
+        login_throttle.release(throttle_keys, attempt)
+        raise
     if not user:
+        login_throttle.record_failure(throttle_keys, attempt)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    login_throttle.record_success(throttle_keys, attempt)
+    refresh_token, _ = issue_refresh_token(db, user)
+    return token_response(user, refresh_token)
+
+@app.post("/api/auth/refresh")
+async def refresh_access_token(refresh_data: dict, db: Session = Depends(get_db)):
+    """Renovar la sesión canjeando el refresh token (sin verificar contraseña)"""
+    raw_token = refresh_data.get("refresh_token")
+    if not raw_token:
+        raise HTTPException(status_code=400, detail="Refresh token required")
     
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "is_admin": user.is_admin
-        }
-    }
+    try:
+        user, refresh_token = rotate_refresh_token(db, raw_token)
+    except InvalidRefreshToken as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    
+    return token_response(user, refresh_token)
+
+@app.post("/api/auth/logout")
+async def logout(refresh_data: dict, db: Session = Depends(get_db)):
+    """Revocar el refresh token de la sesión actual"""
+    raw_token = refresh_data.get("refresh_token")
+    if raw_token:
+        revoke_refresh_token(db, raw_token)
+    return {"success": True, "message": "Logged out"}
 
 @app.get("/api/auth/me")
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
@@ -450,9 +680,127 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
         "is_admin": current_user.is_admin
     }
 
+# Endpoints de retención de interacciones
+@app.get("/api/admin/retention")
+async def get_retention_report(days: Optional[int] = None, current_user: User = Depends(get_current_user)):
+    """Simular la compactación de interacciones antiguas (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view retention")
+    
+    days = INTERACTION_RETENTION_DAYS if days is None else days
+    if days <= 0:
+        raise HTTPException(status_code=400, detail="Days must be greater than 0")
+    
+    report = await asyncio.to_thread(retention_report, days)
+    return {
+        "success": True,
+        "dry_run": True,
+        "data": report
+    }
+
+@app.post("/api/admin/retention/run", status_code=202)
+async def run_retention(current_user: User = Depends(get_current_user)):
+    """Compactar ahora las interacciones antiguas en segundo plano (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can run retention")
+    
+    if INTERACTION_RETENTION_DAYS <= 0:
+        raise HTTPException(status_code=400, detail="Interaction retention is disabled")
+    
+    jobs.spawn(run_interaction_retention)
+    return {
+        "success": True,
+        "message": "Retention started",
+        "retention_days": INTERACTION_RETENTION_DAYS
+    }
+
+# Endpoints de perfilado
+@app.get("/api/admin/profiles")
+async def list_profiles(current_user: User = Depends(get_current_user)):
+    """Listar los perfiles guardados (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view profiles")
+    
+    profiles = await asyncio.to_thread(profile_store.list)
+    return {
+        "success": True,
+        "data": profiles,
+        "sample_rates": sample_rates,
+        "total": len(profiles)
+    }
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "json", current_user: User = Depends(get_current_user)):
+    """Descargar un perfil en JSON o como pilas colapsadas (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view profiles")
+    
+    profile = await asyncio.to_thread(profile_store.load, profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "collapsed":
+        return PlainTextResponse(collapsed_stacks(profile))
+    return {
+        "success": True,
+        "data": profile
+    }
+
+@app.post("/api/admin/profiles/sampling")
+async def set_profile_sampling(sampling_data: dict, current_user: User = Depends(get_current_user)):
+    """Perfilar una fracción de las peticiones de una ruta (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can change profiling")
+    
+    route = sampling_data.get("route")
+    rate = sampling_data.get("rate", 0)
+    if not route:
+        raise HTTPException(status_code=400, detail="Route is required")
+    
+    try:
+        rate = float(rate)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Rate must be a number between 0 and 1")
+    if not 0 <= rate <= 1:
+        raise HTTPException(status_code=400, detail="Rate must be a number between 0 and 1")
+    
+    if rate:
+        sample_rates[route] = rate
+    else:
+        sample_rates.pop(route, None)
+    
+    return {
+        "success": True,
+        "sample_rates": sample_rates
+    }
+
+@app.get("/api/admin/loop-blocks")
+async def list_loop_blocks(current_user: User = Depends(get_current_user)):
+    """Pilas capturadas cuando el event loop quedó bloqueado (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view loop blocks")
+    
+    blocks = loop_monitor.recent_blocks()
+    return {
+        "success": True,
+        "data": blocks,
+        "threshold_seconds": loop_monitor.threshold,
+        "total": len(blocks)
+    }
+
 # Endpoints de chat
+def chat_message_to_dict(msg):
+    return {
+        "id": msg.id,
+        "username": msg.username,
+        "message": msg.message,
+        "is_admin": msg.is_admin,
+        "room_id": msg.room_id,
+        "created_at": msg.created_at.isoformat()
+    }
+
 @app.get("/api/chat/messages/{room_id}")
-async def get_chat_messages(room_id: str, db: Session = Depends(get_db)):
+async def get_chat_messages(room_id: str, db: Session = Depends(get_read_db)):
     """Obtener mensajes de una conversación específica"""
     messages = db.query(ChatMessage).filter(
         ChatMessage.room_id == room_id
@@ -460,21 +808,111 @@ async def get_chat_messages(room_id: str, db: Session = Depends(get_db)):
     
     return {
         "success": True,
-        "data": [
-            {
-                "id": msg.id,
-                "username": msg.username,
-                "message": msg.message,
-                "is_admin": msg.is_admin,
-                "room_id": msg.room_id,
-                "created_at": msg.created_at.isoformat()
-            }
-            for msg in reversed(messages)
-        ]
+        "data": [chat_message_to_dict(msg) for msg in reversed(messages)]
+    }
+
+@app.get("/api/chat/rooms/{room_id}/archive")
+async def get_archived_chat_messages(
+    room_id: str,
+    period: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Obtener mensajes archivados de una conversación, un mes por página (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view archived messages")
+    
+    periods = list_archived_periods(db, room_id)
+    if not period:
+        # Sin mes solo se listan los meses disponibles
+        return {
+            "success": True,
+            "data": [],
+            "periods": periods,
+            "total": 0
+        }
+    
+    try:
+        datetime.strptime(period, "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Period must be YYYY-MM")
+    
+    # Descomprimir fuera del event loop
+    messages = await asyncio.to_thread(load_archived_messages, db, room_id, period)
+    
+    return {
+        "success": True,
+        "data": messages,
+        "periods": periods,
+        "total": len(messages)
+    }
+
+@app.get("/api/chat/search")
+async def search_chat(
+    q: str,
+    page: int = 1,
+    page_size: int = 20,
+    room_id: Optional[str] = None,
+    username: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Buscar en el historial de chat por texto o usuario (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can search chat history")
+    
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query is required")
+    
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), 100)
+    
+    try:
+        results, has_more = search_chat_messages(
+            db, q, limit=page_size, offset=(page - 1) * page_size,
+            room_id=room_id, username=username
+        )
+    except SearchUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    return {
+        "success": True,
+        "data": results,
+        "page": page,
+        "page_size": page_size,
+        "has_more": has_more,
+        # Solo se busca en chat_messages: los meses ya archivados no aparecen
+        "includes_archived": False
     }
 
+@app.get("/api/chat/export")
+async def export_chat_messages(
+    room_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: str = "ndjson",
+    include_archived: bool = True,
+    current_user: User = Depends(get_current_user)
+):
+    """Exportar el historial de una sala o de todas las salas en un rango de fechas (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can export chat history")
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    if not room_id and not (start and end):
+        raise HTTPException(status_code=400, detail="Room ID or a start/end date range is required")
+    
+    filename = f"chat_{room_id or 'all'}.{format}"
+    return StreamingResponse(
+        stream_chat_export(room_id, start, end, format, include_archived),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.get("/api/chat/rooms")
-async def get_chat_rooms(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_chat_rooms(db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)):
     """Obtener todas las salas de chat (solo para admins)"""
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only admins can view chat rooms")
@@ -547,7 +985,7 @@ async def send_chat_message(
     db.commit()
     
     # Emitir mensaje solo a la sala específica
-    await sio.emit('new_message', {
+    await emit('new_message', {
         'id': chat_message.id,
         'username': chat_message.username,
         'message': chat_message.message,
@@ -558,7 +996,7 @@ async def send_chat_message(
     
     return {"success": True, "message": "Message sent"}
 
-@app.delete("/api/chat/rooms/{room_id}")
+@app.delete("/api/chat/rooms/{room_id}", status_code=202)
 async def delete_chat_room(
     room_id: str,
     db: Session = Depends(get_db),
@@ -574,39 +1012,66 @@ async def delete_chat_room(
         raise HTTPException(status_code=404, detail="Chat room not found")
     
     try:
-        # Eliminar todos los mensajes de la sala primero
-        messages_deleted = db.query(ChatMessage).filter(ChatMessage.room_id == room_id).delete()
-        
-        # Eliminar la sala
-        db.query(ChatRoom).filter(ChatRoom.room_id == room_id).delete()
-        
-        # Confirmar cambios
-        db.commit()
+        # Borrado lógico inmediato; los mensajes se purgan en segundo plano
+        job, created = request_room_deletion(db, room, requested_by=current_user.username)
+        if created:
+            jobs.spawn(purge_chat_room, job.id)
         
         return {
             "success": True,
-            "message": "Chat room deleted successfully",
-            "messages_deleted": messages_deleted,
+            "message": "Chat room deletion started",
+            "job_id": job.id,
+            "status": job.status,
             "room_id": room_id
         }
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting chat room: {str(e)}")
 
+@app.get("/api/chat/deletions/{job_id}")
+async def get_chat_room_deletion(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Consultar el progreso del borrado de una conversación (solo admins)"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can view deletion jobs")
+    
+    job = db.get(ChatRoomDeletion, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    
+    return {
+        "success": True,
+        "data": deletion_to_dict(job)
+    }
+
 def generate_room_id(username):
     """Generar un ID único para la sala de chat basado en el username"""
     return hashlib.md5(f"chat_{username}".encode()).hexdigest()[:16]
 
+async def emit(event, data, room):
+    """Emitir un evento registrando a cuántos clientes llega"""
+    recipients = sio.manager.rooms.get('/', {}).get(room, ())
+    metrics.SOCKET_FANOUT.observe(len(recipients), event)
+    await sio.emit(event, data, room=room)
+
 # Socket.IO events
 @sio.event
+@metrics.socket_event
 async def connect(sid, environ):
-    print(f"Cliente conectado: {sid}")
+    metrics.SOCKET_CLIENTS.inc()
+    socket_log.info("Cliente conectado", extra={"event": "socket.connect", "fields": {"sid": sid}})
 
 @sio.event
+@metrics.socket_event
 async def disconnect(sid):
-    print(f"Cliente desconectado: {sid}")
+    metrics.SOCKET_CLIENTS.dec()
+    socket_log.info("Cliente desconectado", extra={"event": "socket.disconnect", "fields": {"sid": sid}})
 
 @sio.event
+@metrics.socket_event
 async def join_room(sid, data):
     """Usuario se une a su sala de chat"""
     username = data.get('username')
@@ -615,7 +1080,7 @@ async def join_room(sid, data):
     
     room_id = generate_room_id(username)
     await sio.enter_room(sid, room_id)
-    print(f"Usuario {username} se unió a la sala {room_id}")
+    chat_log.info("Usuario se unió a su sala", extra={"event": "chat.join", "fields": {"username": username, "room_id": room_id}})
     
     # Crear o actualizar la sala en la base de datos
     db = SessionLocal()
@@ -634,18 +1099,19 @@ async def join_room(sid, data):
             room.is_active = True
         
         db.commit()
-        print(f"Sala de chat creada/actualizada para {username}")
+        chat_log.debug("Sala de chat creada/actualizada para %s", username)
     except Exception as e:
-        print(f"Error creando sala: {e}")
+        chat_log.error("Error creando sala: %s", e)
     finally:
         db.close()
     
-    await sio.emit('room_joined', {
+    await emit('room_joined', {
         'room_id': room_id,
         'message': f'Conectado al chat de Ares Club'
     }, room=sid)
 
 @sio.event
+@metrics.socket_event
 async def admin_join_room(sid, data):
     """Admin se une a una sala específica"""
     room_id = data.get('room_id')
@@ -653,16 +1119,18 @@ async def admin_join_room(sid, data):
         await sio.enter_room(sid, room_id)
         # También unir a la sala de admins
         await sio.enter_room(sid, 'admins')
-        await sio.emit('admin_joined', {'room_id': room_id}, room=sid)
-        print(f"Admin se unió a la sala {room_id}")
+        await emit('admin_joined', {'room_id': room_id}, room=sid)
+        chat_log.info("Admin se unió a una sala", extra={"event": "chat.admin_join", "fields": {"sid": sid, "room_id": room_id}})
 
 @sio.event
+@metrics.socket_event
 async def join_admins(sid, data):
     """Admin se une al canal de notificaciones de admins"""
     await sio.enter_room(sid, 'admins')
-    print(f"Admin {sid} se unió al canal de admins")
+    chat_log.info("Admin se unió al canal de admins", extra={"event": "chat.join_admins", "fields": {"sid": sid}})
 
 @sio.event
+@metrics.socket_event
 async def user_message(sid, data):
     """Manejar mensajes de usuarios"""
     username = data.get('username', 'Usuario Anónimo')
@@ -675,8 +1143,6 @@ async def user_message(sid, data):
     if not room_id:
         room_id = generate_room_id(username)
     
-    print(f"Mensaje recibido de {username} en sala {room_id}: {message}")
-    
     # Guardar mensaje en la base de datos
     db = SessionLocal()
     try:
@@ -704,7 +1170,10 @@ async def user_message(sid, data):
             room.is_active = True
         
         db.commit()
-        print(f"Mensaje guardado en BD: {chat_message.id}")
+        # Sin el texto del mensaje: solo metadatos y muestreado
+        chat_log.info("Mensaje de usuario guardado", extra={"event": "chat.message", "fields": {
+            "message_id": chat_message.id, "room_id": room_id, "length": len(message)
+        }})
         
         # Emitir mensaje solo a la sala específica
         message_data = {
@@ -717,7 +1186,7 @@ async def user_message(sid, data):
         }
         
         # Emitir a la sala del usuario
-        await sio.emit('new_message', message_data, room=room_id)
+        await emit('new_message', message_data, room=room_id)
         
         # Notificar a los admins sobre nuevo mensaje
         admin_notification = {
@@ -728,11 +1197,10 @@ async def user_message(sid, data):
             'created_at': chat_message.created_at.isoformat()
         }
         
-        await sio.emit('new_user_message', admin_notification, room='admins')
-        print(f"Notificación enviada a admins para sala {room_id}")
+        await emit('new_user_message', admin_notification, room='admins')
         
     except Exception as e:
-        print(f"Error guardando mensaje: {e}")
+        chat_log.error("Error guardando mensaje: %s", e)
         db.rollback()
     finally:
         db.close()
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+
+# Configuración de tendencias
+TRENDING_CAPACITY = int(os.getenv("TRENDING_CAPACITY", "64"))
+
+# Ventana: (duración en segundos, tamaño de cada bucket en segundos)
+TRENDING_WINDOWS = {
+    "5m": (300, 10),
+    "1h": (3600, 60),
+    "24h": (86400, 900)
+}
+
+class SpaceSaving:
+    """Top-K aproximado con memoria fija (algoritmo Space-Saving)
+
+    Guarda como máximo `capacity` elementos; al llegar uno nuevo con la tabla
+    llena reemplaza al de menor cuenta y hereda esa cuenta como error máximo.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def offer(self, item, amount=1):
+        if item in self.counts:
+            self.counts[item] += amount
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = amount
+            self.errors[item] = 0
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.counts[item] = floor + amount
+            self.errors[item] = floor
+
+class SlidingTopK:
+    """Space-Saving por buckets de tiempo; la ventana suma los buckets vigentes"""
+
+    def __init__(self, window_seconds, bucket_seconds, capacity=TRENDING_CAPACITY):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self.buckets = deque()  # (índice del bucket, SpaceSaving)
+
+    def _expire(self, now):
+        oldest = int(now // self.bucket_seconds) - self.window_seconds // self.bucket_seconds + 1
+        while self.buckets and self.buckets[0][0] < oldest:
+            self.buckets.popleft()
+
+    def offer(self, item, now):
+        index = int(now // self.bucket_seconds)
+        if not self.buckets or self.buckets[-1][0] != index:
+            self.buckets.append((index, SpaceSaving(self.capacity)))
+        self.buckets[-1][1].offer(item)
+        self._expire(now)
+
+    def top(self, k, now):
+        self._expire(now)
+        counts = Counter()
+        errors = Counter()
+        for _, bucket in self.buckets:
+            counts.update(bucket.counts)
+            errors.update(bucket.errors)
+        return [(item, count, errors[item]) for item, count in counts.most_common(k)]
+
+class TrendingTracker:
+    """Clicks recientes por juego y promoción en varias ventanas, solo en memoria"""
+
+    def __init__(self, kinds=("game", "promo"), windows=TRENDING_WINDOWS):
+        self._lock = threading.Lock()
+        self._windows = {
+            kind: {name: SlidingTopK(length, bucket) for name, (length, bucket) in windows.items()}
+            for kind in kinds
+        }
+
+    def record(self, kind, name, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for window in self._windows[kind].values():
+                window.offer(name, now)
+
+    def top(self, kind, window, k=5, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            items = self._windows[kind][window].top(k, now)
+        return [{"name": name, "clicks": count, "max_overcount": error} for name, count, error in items]
+
+trending = TrendingTracker()
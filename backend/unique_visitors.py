@@ -0,0 +1,201 @@
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, UniqueVisitorSketch
+from hyperloglog import HyperLogLog
+from logs import get_logger
+
+log = get_logger("stats")
+
+# Todos los sketches deben tener la misma precisión para poder combinarse
+HLL_PRECISION = 12
+UNIQUE_VISITORS_FLUSH_INTERVAL = int(os.getenv("UNIQUE_VISITORS_FLUSH_INTERVAL", "60"))
+UNIQUE_VISITORS_MAX_DAYS = int(os.getenv("UNIQUE_VISITORS_MAX_DAYS", "366"))
+
+def _today():
+    return datetime.utcnow().date().isoformat()
+
+def _month(day):
+    return day[:7]
+
+def _days(start, end):
+    day = start
+    while day <= end:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+def _periods(start, end):
+    """Meses completos dentro del rango y días sueltos fuera de ellos"""
+    by_month = {}
+    for day in _days(start, end):
+        by_month.setdefault(_month(day), []).append(day)
+    months, days = [], []
+    for month, month_days in by_month.items():
+        first = date.fromisoformat(month + "-01")
+        last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        if len(month_days) == last.day:
+            months.append(month)
+        else:
+            days.extend(month_days)
+    return months, days
+
+class UniqueVisitorTracker:
+    """Sketches por entidad y día acumulados en memoria y volcados periódicamente a la base
+
+    Cada sketch diario también se combina en uno mensual ("YYYY-MM" en la
+    columna day), así un rango largo combina un sketch por mes completo.
+    """
+
+    def __init__(self):
+        self._pending = {}  # (kind, name, day) -> HyperLogLog
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, visitor):
+        if not visitor:
+            return
+        key = (kind, name, _today())
+        with self._lock:
+            sketch = self._pending.get(key)
+            if sketch is None:
+                sketch = self._pending[key] = HyperLogLog(HLL_PRECISION)
+            sketch.add(visitor)
+
+    def _persist(self, db, kind, name, period, sketch):
+        row = db.query(UniqueVisitorSketch).filter(
+            UniqueVisitorSketch.kind == kind,
+            UniqueVisitorSketch.name == name,
+            UniqueVisitorSketch.day == period
+        ).with_for_update().first()
+        if row:
+            merged = HyperLogLog.from_bytes(row.registers, HLL_PRECISION).merge(sketch)
+            row.registers = merged.to_bytes()
+        else:
+            db.add(UniqueVisitorSketch(kind=kind, name=name, day=period, registers=sketch.to_bytes()))
+        db.commit()
+
+    def _persist_with_retry(self, db, kind, name, period, sketch):
+        try:
+            self._persist(db, kind, name, period, sketch)
+        except IntegrityError:
+            # Otro proceso creó la fila a la vez: combinar con la suya
+            db.rollback()
+            self._persist(db, kind, name, period, sketch)
+
+    def flush(self):
+        """Combinar los sketches pendientes con los guardados"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        db = SessionLocal()
+        try:
+            for (kind, name, day), sketch in pending.items():
+                try:
+                    # Combinar es idempotente: si falla el mensual, reintentar el diario no cuenta doble
+                    self._persist_with_retry(db, kind, name, day, sketch)
+                    self._persist_with_retry(db, kind, name, _month(day), sketch)
+                except Exception as e:
+                    db.rollback()
+                    log.error("Error guardando sketch %s/%s/%s: %s", kind, name, day, e)
+                    # Se conserva en memoria para el próximo volcado
+                    with self._lock:
+                        current = self._pending.get((kind, name, day))
+                        self._pending[(kind, name, day)] = current.merge(sketch) if current else sketch
+            return len(pending)
+        finally:
+            db.close()
+
+    def _pending_for(self, kind, days):
+        with self._lock:
+            return [(name, HyperLogLog(HLL_PRECISION, sketch.registers))
+                    for (k, name, day), sketch in self._pending.items() if k == kind and day in days]
+
+    def _stored(self, db, kind, periods, name=None):
+        if not periods:
+            return []
+        query = db.query(UniqueVisitorSketch.name, UniqueVisitorSketch.day, UniqueVisitorSketch.registers).filter(
+            UniqueVisitorSketch.kind == kind,
+            UniqueVisitorSketch.day.in_(periods)
+        )
+        if name:
+            query = query.filter(UniqueVisitorSketch.name == name)
+        return query.all()
+
+    def estimate(self, db, kind, start, end, name=None):
+        """Visitantes únicos por entidad y en total entre dos días (inclusive)"""
+        months, days = _periods(start, end)
+        month_rows = self._stored(db, kind, months, name)
+        # Meses sin sketch mensual (antes del backfill): se leen sus días
+        missing = set(months) - {period for _, period, _ in month_rows}
+        days += [day for day in _days(start, end) if _month(day) in missing]
+        sketches = [(n, registers) for n, _, registers in month_rows + self._stored(db, kind, days, name)]
+
+        # Primero se combina por entidad y el total solo combina un sketch por entidad
+        by_name = {}
+        for n, registers in sketches:
+            sketch = HyperLogLog.from_bytes(registers, HLL_PRECISION)
+            if n in by_name:
+                by_name[n].merge(sketch)
+            else:
+                by_name[n] = sketch
+        for n, sketch in self._pending_for(kind, set(_days(start, end))):
+            if name and n != name:
+                continue
+            if n in by_name:
+                by_name[n].merge(sketch)
+            else:
+                by_name[n] = sketch
+
+        total = HyperLogLog(HLL_PRECISION)
+        for sketch in by_name.values():
+            total.merge(sketch)
+
+        return {
+            "by_name": {n: sketch.count() for n, sketch in sorted(by_name.items())},
+            "total": total.count(),
+            "relative_error": round(1.04 / (1 << HLL_PRECISION) ** 0.5, 4)
+        }
+
+    def backfill_monthly(self):
+        """Armar los sketches mensuales a partir de los diarios guardados antes de existir"""
+        db = SessionLocal()
+        try:
+            days = db.query(UniqueVisitorSketch.kind, UniqueVisitorSketch.name, UniqueVisitorSketch.day).filter(
+                func.length(UniqueVisitorSketch.day) == 10
+            ).all()
+            months = {(kind, name, _month(day)) for kind, name, day in days}
+            existing = set(db.query(UniqueVisitorSketch.kind, UniqueVisitorSketch.name, UniqueVisitorSketch.day).filter(
+                func.length(UniqueVisitorSketch.day) == 7
+            ).all())
+            # El mes actual y el anterior se recombinan siempre: un volcado pudo crear
+            # su sketch mensual antes del backfill. Combinar de nuevo es idempotente
+            recent = {_month(_today()), _month((datetime.utcnow().replace(day=1) - timedelta(days=1)).date().isoformat())}
+            built = 0
+            for kind, name, month in sorted(months):
+                if (kind, name, month) in existing and month not in recent:
+                    continue
+                merged = HyperLogLog(HLL_PRECISION)
+                for (registers,) in db.query(UniqueVisitorSketch.registers).filter(
+                    UniqueVisitorSketch.kind == kind,
+                    UniqueVisitorSketch.name == name,
+                    UniqueVisitorSketch.day.like(month + "-%")
+                ):
+                    merged.merge(HyperLogLog.from_bytes(registers, HLL_PRECISION))
+                self._persist_with_retry(db, kind, name, month, merged)
+                built += 1
+            if built:
+                log.info("Sketches mensuales de visitantes únicos creados: %s", built)
+            return built
+        except Exception as e:
+            db.rollback()
+            log.error("Error creando sketches mensuales: %s", e)
+            return 0
+        finally:
+            db.close()
+
+unique_visitors = UniqueVisitorTracker()
@@ -7,11 +7,20 @@ Tests all API endpoints and database connectivity for PostgreSQL migration
 import requests
 import sys
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Any
 
 class AresClubAPITester:
-    def __init__(self, base_url="http://localhost:8001"):
+    def __init__(self, base_url=None):
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+            self.tests_run = 0
+            self.tests_passed = 0
+            self.test_results = []
+            return
+        base_url = "http://localhost:8001"
         # Use the public URL from frontend .env if available
         try:
             with open('/app/frontend/.env.production', 'r') as f:
@@ -292,6 +301,23 @@ class AresClubAPITester:
         
         return success
 
+    def test_parallel_logins(self, login_data: Dict[str, str], parallel: int = 8):
+        """N concurrent correct logins for one user all return 200"""
+        print(f"\n🔍 Testing {parallel} Parallel Correct Logins...")
+        
+        def login(_):
+            try:
+                return requests.post(f"{self.base_url}/api/auth/login", json=login_data, timeout=30).status_code
+            except requests.exceptions.RequestException as e:
+                return str(e)
+        
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            statuses = list(executor.map(login, range(parallel)))
+        
+        success = all(status == 200 for status in statuses)
+        self.log_test(f"{parallel} Parallel Correct Logins", success, f"Statuses: {statuses}")
+        return success
+
     def test_auth_endpoints(self):
         """Test authentication endpoints"""
         # Test login with correct credentials
@@ -337,6 +363,9 @@ class AresClubAPITester:
         if success and me_response:
             print(f"   ✅ Protected endpoint accessible, user: {me_response.get('username')}")
         
+        # Parallel logins with the right password must never trip the failure limit
+        self.test_parallel_logins(login_data)
+        
         # Test invalid credentials
         invalid_login = {
             "username": "admin",
@@ -356,6 +385,46 @@ class AresClubAPITester:
         
         return success
 
+    def create_test_room(self, username: str):
+        """Create a chat room the way the frontend does: join it over Socket.IO"""
+        try:
+            import socketio
+        except ImportError:
+            print("   ⚠️  python-socketio not installed, cannot create a test room")
+            return None
+        
+        client = socketio.Client()
+        joined = {}
+        client.on("room_joined", lambda data: joined.update(data))
+        try:
+            client.connect(self.base_url, transports=["polling"])
+            client.emit("join_room", {"username": username})
+            for _ in range(50):
+                if joined:
+                    break
+                time.sleep(0.1)
+        except Exception as e:
+            print(f"   ⚠️  Could not create test room: {e}")
+        finally:
+            client.disconnect()
+        return joined.get("room_id")
+
+    def wait_for_room_deletion(self, job_id: int, headers: Dict[str, str], timeout: float = 30):
+        """Poll the deletion job until it finishes; returns the last job state"""
+        deadline = time.time() + timeout
+        job = None
+        while time.time() < deadline:
+            response = requests.get(f"{self.base_url}/api/chat/deletions/{job_id}", headers=headers, timeout=10)
+            if response.status_code != 200:
+                print(f"   ❌ Deletion job {job_id}: status {response.status_code}")
+                return None
+            job = response.json().get("data", {})
+            if job.get("status") in ("done", "failed"):
+                break
+            time.sleep(0.5)
+        self.log_test(f"Chat Room Deletion Job {job_id}", bool(job) and job.get("status") == "done", f"Status: {job and job.get('status')}")
+        return job
+
     def test_chat_endpoints(self):
         """Test chat endpoints including new DELETE functionality"""
         # First login to get admin token
@@ -410,75 +479,67 @@ class AresClubAPITester:
                     messages = messages_response.get("data", [])
                     print(f"   ✅ Found {len(messages)} messages in room {test_room_id}")
                 
-                # Test DELETE chat room endpoint (NEW FUNCTIONALITY)
+                # Test DELETE chat room endpoint: returns 202 and purges in the background
                 success, delete_response = self.run_test(
                     f"DELETE Chat Room {test_room_id} ({test_username})",
                     "DELETE",
                     f"/api/chat/rooms/{test_room_id}",
-                    200,
+                    202,
                     headers=headers
                 )
                 
-                if success and delete_response:
-                    if delete_response.get("success"):
-                        messages_deleted = delete_response.get("messages_deleted", 0)
-                        print(f"   ✅ Chat room deleted successfully - {messages_deleted} messages removed")
-                        
-                        # Verify room is actually deleted by trying to get it again
-                        success_verify, rooms_after = self.run_test(
-                            "Verify Room Deletion - Get Rooms Again",
-                            "GET",
-                            "/api/chat/rooms",
-                            200,
-                            headers=headers
-                        )
-                        
-                        if success_verify:
-                            remaining_rooms = rooms_after.get("data", [])
-                            room_still_exists = any(r["room_id"] == test_room_id for r in remaining_rooms)
-                            if not room_still_exists:
-                                print(f"   ✅ Room {test_room_id} successfully removed from list")
-                            else:
-                                print(f"   ⚠️  Room {test_room_id} still appears in list after deletion")
-                    else:
-                        print(f"   ❌ Delete response indicates failure: {delete_response}")
+                if success and delete_response.get("success") and delete_response.get("job_id"):
+                    print(f"   ✅ Chat room deletion started - job {delete_response['job_id']}")
+                    
+                    job = self.wait_for_room_deletion(delete_response["job_id"], headers)
+                    if not job or job.get("status") != "done":
+                        print(f"   ❌ Deletion job did not finish: {job}")
                         return False
+                    print(f"   ✅ Chat room deleted successfully - {job.get('messages_deleted', 0)} messages removed")
+                    
+                    # Verify room is actually deleted by trying to get it again
+                    success_verify, rooms_after = self.run_test(
+                        "Verify Room Deletion - Get Rooms Again",
+                        "GET",
+                        "/api/chat/rooms",
+                        200,
+                        headers=headers
+                    )
+                    
+                    if success_verify:
+                        remaining_rooms = rooms_after.get("data", [])
+                        room_still_exists = any(r["room_id"] == test_room_id for r in remaining_rooms)
+                        if not room_still_exists:
+                            print(f"   ✅ Room {test_room_id} successfully removed from list")
+                        else:
+                            print(f"   ⚠️  Room {test_room_id} still appears in list after deletion")
                 else:
-                    print("   ❌ Failed to delete chat room")
+                    print(f"   ❌ Failed to delete chat room: {delete_response}")
                     return False
             else:
                 print("   ℹ️  No chat rooms found to test delete functionality")
-                # Create a test room by sending a message first
-                test_message_data = {
-                    "message": "Test message to create room for deletion test",
-                    "room_id": "test_delete_room_123"
-                }
+                # Rooms are only created over Socket.IO: join one as a test user
+                test_room_id = self.create_test_room("test_delete_room_user")
                 
-                success, send_response = self.run_test(
-                    "Create Test Room for Deletion",
-                    "POST",
-                    "/api/chat/send",
-                    200,
-                    data=test_message_data,
-                    headers=headers
-                )
-                
-                if success:
+                if test_room_id:
                     print("   ✅ Test room created")
                     
                     # Now test delete on this room
                     success, delete_response = self.run_test(
                         "DELETE Test Room",
                         "DELETE",
-                        "/api/chat/rooms/test_delete_room_123",
-                        200,
+                        f"/api/chat/rooms/{test_room_id}",
+                        202,
                         headers=headers
                     )
                     
-                    if success and delete_response.get("success"):
+                    job = None
+                    if success and delete_response.get("job_id"):
+                        job = self.wait_for_room_deletion(delete_response["job_id"], headers)
+                    if job and job.get("status") == "done":
                         print("   ✅ Test room deleted successfully")
                     else:
-                        print("   ❌ Failed to delete test room")
+                        print(f"   ❌ Failed to delete test room: {job or delete_response}")
                         return False
         
         # Test unauthorized delete (without admin token)
@@ -614,6 +675,12 @@ def main():
     print("Testing PostgreSQL migration and API functionality")
     print("-" * 60)
     
+    # --embedded starts the API locally on an in-memory SQLite database
+    if "--embedded" in sys.argv:
+        from benchmarks.common import start_server
+        with start_server("sqlite://", {"BCRYPT_ROUNDS": "4"}) as base_url:
+            return AresClubAPITester(base_url).run_all_tests()
+    
     # Initialize tester
     tester = AresClubAPITester()
     
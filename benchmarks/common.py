@@ -0,0 +1,146 @@
+"""
+Ares Club Casino - Benchmark helpers
+Shared server startup, statistics and result files for the benchmark scripts
+"""
+
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(REPO_ROOT, "backend")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+def git_sha():
+    """Current commit, so results can be compared between commits"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def summarize(latencies, elapsed, errors=0, statuses=None):
+    """Latency percentiles in milliseconds and throughput in requests per second"""
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "statuses": statuses or {},
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else None
+    }
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def start_server(database_url=None, extra_env=None, startup_timeout=60):
+    """Start the API with uvicorn in a subprocess and yield its base URL
+
+    Without database_url a throwaway SQLite file is used; pass a Postgres
+    URL to benchmark against a local Postgres instead.
+    """
+    workdir = tempfile.mkdtemp(prefix="ares-bench-")
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "PROFILE_DIR": os.path.join(workdir, "profiles"),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING")
+    })
+    env.update(extra_env or {})
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:socket_app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                if requests.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                    break
+            except requests.exceptions.RequestException:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError("Server did not become healthy in time")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def write_results(kind, results, output=None):
+    """Write results as JSON with enough metadata to compare runs"""
+    sha = git_sha()
+    document = {
+        "kind": kind,
+        "git_sha": sha,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{kind}-{sha or 'nogit'}-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+    return output
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare_metrics(baseline, current, tolerance, lower_is_better=True):
+    """Compare two {name: value} maps; return rows and the names that regressed"""
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        old, new = baseline[name], current[name]
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = change > tolerance if lower_is_better else change < -tolerance
+        rows.append((name, old, new, change, regressed))
+        if regressed:
+            regressions.append(name)
+    return rows, regressions
+
+def print_comparison(rows, unit):
+    for name, old, new, change, regressed in rows:
+        marker = "❌" if regressed else "✅"
+        print(f"{marker} {name:<45} {old:>12.3f} -> {new:>12.3f} {unit:<5} ({change:+.1%})")
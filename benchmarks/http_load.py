@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Ares Club Casino - HTTP Load Benchmark
+Drives catalog, tracking, contact, login and chat-history endpoints at
+configurable concurrency and reports latency percentiles and throughput
+
+Usage:
+    python benchmarks/http_load.py run --concurrency 1,8,32 --requests 500
+    python benchmarks/http_load.py run --database-url postgresql://localhost/ares_bench
+    python benchmarks/http_load.py compare old.json new.json --tolerance 0.15
+"""
+
+import argparse
+import itertools
+import sys
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from common import (start_server, summarize, write_results, load_results,
+                    compare_metrics, print_comparison)
+
+BENCH_ROOM = "bench-room"
+
+def server_env(concurrency_levels):
+    """Limits for the started server so login is measured on the bcrypt path
+
+    With the defaults (5 attempts per user, 20 per IP, 32 queued hashes) most
+    concurrent logins of the single benchmark user would wait on the throttle
+    or hit the 503 fast path instead of hashing.
+    """
+    peak = max(concurrency_levels)
+    return {
+        "LOGIN_THROTTLE_MAX_ATTEMPTS": str(max(1000, peak * 4)),
+        "LOGIN_THROTTLE_MAX_ATTEMPTS_IP": str(max(1000, peak * 4)),
+        "PASSWORD_POOL_MAX_PENDING": str(max(32, peak * 2))
+    }
+
+def check_errors(name, concurrency, summary, max_error_rate):
+    """Discard latencies of an endpoint that mostly measured error responses"""
+    total = summary["requests"] + summary["errors"]
+    rate = summary["errors"] / total if total else 0
+    if rate <= max_error_rate:
+        return True
+    print(f"   ⚠️  {name} c={concurrency}: {rate:.1%} non-2xx responses {summary['statuses']}, "
+          f"latencies discarded (--max-error-rate {max_error_rate:.0%})")
+    summary["invalid"] = True
+    for metric in ("throughput_rps", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"):
+        summary[metric] = None
+    return False
+
+def build_endpoints(token, games, promos, credentials):
+    """Endpoint name -> (method, path factory, body factory, headers)"""
+    game_ids = itertools.cycle(games)
+    promo_ids = itertools.cycle(promos)
+    counter = itertools.count()
+    admin = {"Authorization": f"Bearer {token}"}
+    return {
+        "catalog.games": ("GET", lambda: "/api/games", None, None),
+        "catalog.promotions": ("GET", lambda: "/api/promotions", None, None),
+        "catalog.payment_methods": ("GET", lambda: "/api/payment-methods", None, None),
+        "catalog.faq": ("GET", lambda: "/api/faq", None, None),
+        "tracking.game_view": ("GET", lambda: f"/api/games/{next(game_ids)}", None, None),
+        "tracking.game_click": ("POST", lambda: f"/api/games/{next(game_ids)}/interact", lambda: {}, None),
+        "tracking.promo_click": ("POST", lambda: f"/api/promotions/{next(promo_ids)}/interact", lambda: {}, None),
+        "contact.submit": ("POST", lambda: "/api/contact", lambda: {
+            "name": "Bench User",
+            "phone": f"+54911{next(counter):08d}",
+            "message": "Contacto desde benchmark",
+            "source": "benchmark"
+        }, None),
+        "auth.login": ("POST", lambda: "/api/auth/login", lambda: credentials, None),
+        "chat.history": ("GET", lambda: f"/api/chat/messages/{BENCH_ROOM}", None, None),
+        "chat.rooms": ("GET", lambda: "/api/chat/rooms", None, admin)
+    }
+
+def prepare(base_url, username, password, chat_seed):
+    """Log in as admin, read catalog ids and seed the chat room"""
+    response = requests.post(f"{base_url}/api/auth/login", timeout=30,
+                             json={"username": username, "password": password})
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    games = [g["id"] for g in requests.get(f"{base_url}/api/games", timeout=10).json()["data"]]
+    promos = [p["id"] for p in requests.get(f"{base_url}/api/promotions", timeout=10).json()["data"]]
+
+    with requests.Session() as session:
+        for i in range(chat_seed):
+            session.post(f"{base_url}/api/chat/send", headers=headers, timeout=10, json={
+                "room_id": BENCH_ROOM,
+                "message": f"Mensaje de benchmark {i}"
+            }).raise_for_status()
+    return token, games, promos
+
+def run_endpoint(base_url, endpoint, concurrency, total_requests, duration, warmup):
+    """Send requests from `concurrency` threads until the budget is spent"""
+    method, path, body, headers = endpoint
+    lock = threading.Lock()
+    remaining = [total_requests]
+    latencies = []
+    statuses = Counter()
+    errors = [0]
+    deadline = [None]
+
+    def take():
+        with lock:
+            if deadline[0] is not None and time.perf_counter() >= deadline[0]:
+                return False
+            if duration is None:
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+            return True
+
+    def worker():
+        local_latencies = []
+        local_statuses = Counter()
+        local_errors = 0
+        with requests.Session() as session:
+            for _ in range(warmup):
+                try:
+                    session.request(method, base_url + path(), json=body() if body else None,
+                                    headers=headers, timeout=30)
+                except requests.exceptions.RequestException:
+                    pass
+            start_barrier.wait()
+            while take():
+                url = base_url + path()
+                payload = body() if body else None
+                started = time.perf_counter()
+                try:
+                    response = session.request(method, url, json=payload, headers=headers, timeout=30)
+                    response.content
+                    elapsed = time.perf_counter() - started
+                    local_statuses[str(response.status_code)] += 1
+                    if response.status_code < 300:
+                        local_latencies.append(elapsed)
+                    else:
+                        local_errors += 1
+                except requests.exceptions.RequestException:
+                    local_statuses["error"] += 1
+                    local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+            errors[0] += local_errors
+
+    start_barrier = threading.Barrier(concurrency + 1)
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    if duration is not None:
+        deadline[0] = started + duration
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, errors[0], dict(statuses))
+
+def print_summary(name, concurrency, summary):
+    print(f"   {name:<26} c={concurrency:<4} {summary['throughput_rps'] or 0:>9.1f} req/s"
+          f"  p50 {summary['p50_ms'] or 0:>8.2f} ms  p95 {summary['p95_ms'] or 0:>8.2f} ms"
+          f"  p99 {summary['p99_ms'] or 0:>8.2f} ms  errors {summary['errors']}")
+
+def run_benchmark(args, base_url):
+    token, games, promos = prepare(base_url, args.username, args.password, args.chat_seed)
+    endpoints = build_endpoints(token, games, promos, {"username": args.username, "password": args.password})
+    selected = [name for name in endpoints
+                if not args.endpoints or any(name.startswith(prefix) for prefix in args.endpoints.split(","))]
+
+    results = {}
+    invalid = []
+    for concurrency in _concurrency_levels(args):
+        print(f"\n🚀 Concurrency {concurrency}")
+        results[str(concurrency)] = {}
+        for name in selected:
+            summary = run_endpoint(base_url, endpoints[name], concurrency,
+                                   args.requests, args.duration, args.warmup)
+            results[str(concurrency)][name] = summary
+            if check_errors(name, concurrency, summary, args.max_error_rate):
+                print_summary(name, concurrency, summary)
+            else:
+                invalid.append(f"c{concurrency}/{name}")
+    return results, invalid
+
+def _concurrency_levels(args):
+    return [int(c) for c in args.concurrency.split(",")]
+
+def command_run(args):
+    settings = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "duration": args.duration,
+        "database": "external" if args.url else ("custom" if args.database_url else "sqlite")
+    }
+    if args.url:
+        results, invalid = run_benchmark(args, args.url.rstrip("/"))
+    else:
+        with start_server(args.database_url, server_env(_concurrency_levels(args))) as base_url:
+            results, invalid = run_benchmark(args, base_url)
+
+    path = write_results("http", {"settings": settings, "concurrency": results}, args.output)
+    print(f"\n📄 Results written to {path}")
+    if invalid:
+        print(f"\n❌ {len(invalid)} endpoints returned too many errors to be measured: {', '.join(invalid)}")
+        return 1
+    return 0
+
+def _flatten(document, metric):
+    return {
+        f"c{concurrency}/{name}": summary.get(metric)
+        for concurrency, endpoints in document["results"]["concurrency"].items()
+        for name, summary in endpoints.items()
+    }
+
+def command_compare(args):
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    print(f"Comparing {baseline.get('git_sha')} -> {current.get('git_sha')} (tolerance {args.tolerance:.0%})")
+
+    regressions = []
+    for metric, lower_is_better, unit in (("p95_ms", True, "ms"), ("p99_ms", True, "ms"),
+                                          ("throughput_rps", False, "rps")):
+        print(f"\n📊 {metric}")
+        rows, regressed = compare_metrics(_flatten(baseline, metric), _flatten(current, metric),
+                                          args.tolerance, lower_is_better)
+        print_comparison(rows, unit)
+        regressions.extend(f"{name} {metric}" for name in regressed)
+
+    if regressions:
+        print(f"\n⚠️  {len(regressions)} regressions beyond {args.tolerance:.0%}")
+        return 1
+    print("\n🎉 No regressions")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load benchmark for the Ares Club API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Run the benchmark")
+    run.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    run.add_argument("--database-url", help="Database for the started server (default: temporary SQLite)")
+    run.add_argument("--concurrency", default="1,8,32", help="Comma separated concurrency levels")
+    run.add_argument("--requests", type=int, default=300, help="Requests per endpoint and concurrency level")
+    run.add_argument("--duration", type=float, help="Seconds per endpoint instead of a request count")
+    run.add_argument("--warmup", type=int, default=2, help="Unmeasured requests per thread")
+    run.add_argument("--endpoints", help="Comma separated name prefixes, e.g. catalog,chat.history")
+    run.add_argument("--username", default="admin")
+    run.add_argument("--password", default="admin123")
+    run.add_argument("--chat-seed", type=int, default=200, help="Messages seeded in the benchmark room")
+    run.add_argument("--max-error-rate", type=float, default=0.01,
+                     help="Fail when an endpoint's share of non-2xx responses is higher")
+    run.add_argument("--output", help="Results file (default: benchmarks/results/http-<sha>-<time>.json)")
+
+    compare = subparsers.add_parser("compare", help="Compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative change")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return command_run(args)
+    return command_compare(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
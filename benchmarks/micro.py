@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Ares Club Casino - Hot Path Micro-benchmarks
+Times per-request helpers in-process and compares them with a stored baseline
+
+Usage:
+    python benchmarks/micro.py run
+    python benchmarks/micro.py save-baseline
+    python benchmarks/micro.py compare --tolerance 0.3
+
+Timings are compared relative to a pure-Python reference loop timed next to
+each helper, so a baseline recorded on one machine stays meaningful on another.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+from common import BACKEND_DIR, REPO_ROOT, write_results, load_results, compare_metrics, print_comparison
+
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines", "micro.json")
+REFERENCE = "reference.loop"
+
+def load_backend():
+    """Import the backend against a throwaway SQLite database"""
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='ares-micro-'), 'micro.db')}")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+    import server
+    import database
+    return server, database
+
+def build_benchmarks():
+    """Benchmark name -> zero-argument callable"""
+    import json
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fastapi.security import HTTPAuthorizationCredentials
+    from socketio import packet
+
+    server, database = load_backend()
+
+    token = server.create_access_token({"sub": "admin"})
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    server.verify_token(credentials)
+
+    created_at = datetime.utcnow()
+    message = database.ChatMessage(
+        id=1, username="usuario123", message="Hola, quiero mi usuario",
+        room_id="0123456789abcdef", is_admin=False, created_at=created_at
+    )
+    history = [
+        database.ChatMessage(id=i, username="usuario123", message=f"Mensaje {i}",
+                             room_id="0123456789abcdef", is_admin=i % 2 == 0, created_at=created_at)
+        for i in range(50)
+    ]
+
+    games_response = {"success": True, "data": server.GAMES, "total": len(server.GAMES)}
+    history_response = {"success": True, "data": [server.chat_message_to_dict(msg) for msg in history]}
+    last_game_id = server.GAMES[-1]["id"]
+    last_promo_id = server.PROMOTIONS[-1]["id"]
+
+    def reference_loop():
+        total = 0
+        for i in range(100):
+            total += i
+        return total
+
+    return {
+        REFERENCE: reference_loop,
+        "room_id.server": lambda: server.generate_room_id("usuario123"),
+        "room_id.database": lambda: database.generate_room_id("usuario123"),
+        "jwt.create_access_token": lambda: server.create_access_token({"sub": "admin"}),
+        "jwt.decode": lambda: server.jwt.decode(token, server.SECRET_KEY, algorithms=[server.ALGORITHM]),
+        "jwt.verify_token_cached": lambda: server.verify_token(credentials),
+        "chat.message_dict": lambda: server.chat_message_to_dict(message),
+        "chat.history_dicts": lambda: [server.chat_message_to_dict(msg) for msg in reversed(history)],
+        "catalog.game_lookup": lambda: server.find_game(last_game_id),
+        "catalog.promo_lookup": lambda: server.find_promotion(last_promo_id),
+        "catalog.active_promotions": server.active_promotions,
+        "serialize.games_json": lambda: json.dumps(games_response),
+        "serialize.games_response": lambda: JSONResponse(jsonable_encoder(games_response)).body,
+        "serialize.history_response": lambda: JSONResponse(jsonable_encoder(history_response)).body,
+        "serialize.socketio_packet": lambda: packet.Packet(
+            packet.EVENT, data=["new_message", history_response["data"][0]]).encode()
+    }
+
+def _timer(func):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return timer, number
+
+def measure(func, reference, repeat):
+    """Median nanoseconds per call, and the median ratio to the reference
+
+    The reference loop is timed right before each run of the helper and every
+    pair gives one ratio, so CPU frequency changes and noisy neighbours affect
+    both sides alike; the median discards the odd outlier pair.
+    """
+    timer, number = _timer(func)
+    reference_timer, reference_number = _timer(reference)
+    samples, ratios = [], []
+    for _ in range(repeat):
+        reference_time = reference_timer.timeit(reference_number) / reference_number
+        sample = timer.timeit(number) / number
+        samples.append(sample)
+        ratios.append(sample / reference_time)
+    return statistics.median(samples) * 1e9, statistics.median(ratios)
+
+def run_benchmarks(repeat, selected=None, quiet=False):
+    benchmarks = build_benchmarks()
+    reference = benchmarks.pop(REFERENCE)
+    results = {}
+    for name, func in benchmarks.items():
+        if selected and name not in selected and not any(name.startswith(prefix) for prefix in selected):
+            continue
+        ns, relative = measure(func, reference, repeat)
+        results[name] = {"ns_per_call": round(ns, 1), "relative": round(relative, 4)}
+        if not quiet:
+            print(f"   {name:<32} {ns:>12.1f} ns  {relative:>9.3f} x")
+    return results
+
+def confirm_regressions(baseline, regressions, repeat, tolerance, attempts):
+    """Re-measure each regressed helper; keep only those slower on every attempt"""
+    confirmed = []
+    for name in regressions:
+        for attempt in range(attempts):
+            relative = run_benchmarks(repeat, [name], quiet=True)[name]["relative"]
+            change = (relative - baseline[name]) / baseline[name]
+            print(f"   re-run {attempt + 1}/{attempts} {name:<32} {relative:>9.3f} x ({change:+.1%})")
+            if change <= tolerance:
+                break
+        else:
+            confirmed.append(name)
+    return confirmed
+
+def _relative(document):
+    return {name: result["relative"] for name, result in document["results"].items()}
+
+def command_run(args):
+    print("🔍 Running micro-benchmarks...")
+    results = run_benchmarks(args.repeat, args.only.split(",") if args.only else None)
+    path = write_results("micro", results, args.output)
+    print(f"\n📄 Results written to {path}")
+    return 0
+
+def command_save_baseline(args):
+    print("🔍 Recording micro-benchmark baseline...")
+    os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+    path = write_results("micro", run_benchmarks(args.repeat), args.baseline)
+    print(f"\n📄 Baseline written to {path}")
+    return 0
+
+def command_compare(args):
+    baseline = load_results(args.baseline)
+    if args.current:
+        current = load_results(args.current)
+    else:
+        print("🔍 Running micro-benchmarks...")
+        current = {"git_sha": None, "results": run_benchmarks(args.repeat)}
+
+    print(f"\nComparing against baseline {baseline.get('git_sha')} (tolerance {args.tolerance:.0%}, "
+          f"relative to {REFERENCE})")
+    rows, regressions = compare_metrics(_relative(baseline), _relative(current), args.tolerance)
+    print_comparison(rows, "x")
+
+    # A single slow measurement is usually noise: only fail if it reproduces
+    if regressions and not args.current and args.confirm:
+        print(f"\n🔁 Re-running {len(regressions)} regressed helpers to confirm...")
+        regressions = confirm_regressions(_relative(baseline), regressions, args.repeat, args.tolerance, args.confirm)
+
+    if regressions:
+        print(f"\n⚠️  {len(regressions)} helpers regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    print("\n🎉 No regressions")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for Ares Club hot-path helpers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Run the micro-benchmarks")
+    run.add_argument("--only", help="Comma separated name prefixes, e.g. jwt,serialize")
+    run.add_argument("--output", help="Results file (default: benchmarks/results/micro-<sha>-<time>.json)")
+
+    save = subparsers.add_parser("save-baseline", help="Run and store the results as the new baseline")
+    save.add_argument("--baseline", default=BASELINE_PATH)
+
+    compare = subparsers.add_parser("compare", help="Compare with the baseline; exit 1 on regressions")
+    compare.add_argument("--baseline", default=BASELINE_PATH)
+    compare.add_argument("--current", help="Compare an existing results file instead of running now")
+    compare.add_argument("--tolerance", type=float, default=0.3, help="Allowed relative slowdown")
+    compare.add_argument("--confirm", type=int, default=2,
+                         help="Re-runs a regression must survive before failing (0 disables)")
+
+    for sub in (run, save, compare):
+        sub.add_argument("--repeat", type=int, default=9, help="Timing repetitions, the median is kept")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return command_run(args)
+    if args.command == "save-baseline":
+        return command_save_baseline(args)
+    return command_compare(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
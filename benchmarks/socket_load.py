@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Ares Club Casino - Socket.IO Chat Benchmark
+Simulates N chat users and M admins against the Socket.IO server and
+measures message delivery latency, admin fan-out latency and connection
+setup rate as N grows, producing a capacity curve
+
+Usage:
+    python benchmarks/socket_load.py run --users 10,50,100,200 --admins 3
+    python benchmarks/socket_load.py compare old.json new.json --tolerance 0.2
+
+Talks Engine.IO v4 / Socket.IO v5 directly over the `websockets` package
+(installed with uvicorn[standard]) so no Socket.IO client is needed.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+
+import websockets
+
+from common import (start_server, summarize, write_results, load_results,
+                    compare_metrics, print_comparison)
+
+class BenchSocket:
+    """Minimal Socket.IO client: default namespace, websocket transport, events only"""
+
+    def __init__(self, base_url, on_event, role):
+        self.role = role
+        self.room_id = None
+        self.url = base_url.replace("http://", "ws://").replace("https://", "wss://") + \
+            "/socket.io/?EIO=4&transport=websocket"
+        self.on_event = on_event
+        self.ws = None
+        self._reader = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, max_size=None, ping_interval=None)
+        opening = await self.ws.recv()
+        if not opening.startswith("0"):
+            raise RuntimeError(f"Unexpected Engine.IO open packet: {opening!r}")
+        await self.ws.send("40")
+        while True:
+            packet = await self.ws.recv()
+            if packet.startswith("40"):
+                break
+            if packet.startswith("44"):
+                raise RuntimeError(f"Namespace connection refused: {packet!r}")
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for packet in self.ws:
+                received = time.perf_counter()
+                if packet == "2":
+                    await self.ws.send("3")
+                elif packet.startswith("42"):
+                    event, *args = json.loads(packet[2:])
+                    self.on_event(self, event, args[0] if args else None, received)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def emit(self, event, data):
+        await self.ws.send("42" + json.dumps([event, data]))
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+class ChatScenario:
+    """One capacity point: M admins listening, N users chatting"""
+
+    def __init__(self, base_url, users, admins, messages, interval, drain_timeout):
+        self.base_url = base_url
+        self.user_count = users
+        self.admin_count = admins
+        self.messages = messages
+        self.interval = interval
+        self.drain_timeout = drain_timeout
+        self.run_id = f"{int(time.time())}{random.randint(0, 999):03d}"
+
+        self.joined = {}
+        self.sent = {}
+        self.delivered = {}
+        self.fanout = defaultdict(list)
+
+    def _on_event(self, socket, event, data, received):
+        if event == "room_joined":
+            future = self.joined.get(socket)
+            if future and not future.done():
+                future.set_result((data["room_id"], received))
+        elif event == "new_message" and not data.get("is_admin"):
+            key = data.get("message")
+            if key in self.sent and socket.role == "user" and key not in self.delivered:
+                self.delivered[key] = received - self.sent[key]
+        elif event == "new_user_message":
+            key = data.get("message")
+            if key in self.sent:
+                self.fanout[key].append(received - self.sent[key])
+
+    async def _connect_user(self, index):
+        socket = BenchSocket(self.base_url, self._on_event, "user")
+        started = time.perf_counter()
+        self.joined[socket] = asyncio.get_running_loop().create_future()
+        await socket.connect()
+        await socket.emit("join_room", {"username": f"bench_{self.run_id}_{index}"})
+        socket.room_id, joined_at = await asyncio.wait_for(self.joined[socket], 30)
+        return socket, joined_at - started
+
+    async def _connect_admin(self):
+        socket = BenchSocket(self.base_url, self._on_event, "admin")
+        await socket.connect()
+        await socket.emit("join_admins", {})
+        return socket
+
+    async def _chat(self, socket, index):
+        await asyncio.sleep(random.random() * self.interval)
+        for n in range(self.messages):
+            key = f"bench {self.run_id} {index} {n}"
+            self.sent[key] = time.perf_counter()
+            await socket.emit("user_message", {
+                "username": f"bench_{self.run_id}_{index}",
+                "message": key,
+                "room_id": socket.room_id
+            })
+            await asyncio.sleep(self.interval)
+
+    async def run(self):
+        admins = [await self._connect_admin() for _ in range(self.admin_count)]
+
+        started = time.perf_counter()
+        connected = await asyncio.gather(*(self._connect_user(i) for i in range(self.user_count)),
+                                         return_exceptions=True)
+        connect_elapsed = time.perf_counter() - started
+        users = [result[0] for result in connected if not isinstance(result, BaseException)]
+        setup_latencies = [result[1] for result in connected if not isinstance(result, BaseException)]
+        connect_errors = len(connected) - len(users)
+
+        # Admins also follow some rooms, as the chat panel does
+        for i, user in enumerate(users):
+            if admins:
+                admin = admins[i % len(admins)]
+                await admin.emit("admin_join_room", {"room_id": user.room_id})
+
+        chat_started = time.perf_counter()
+        await asyncio.gather(*(self._chat(user, i) for i, user in enumerate(users)))
+        deadline = time.perf_counter() + self.drain_timeout
+        while time.perf_counter() < deadline and not self._drained():
+            await asyncio.sleep(0.05)
+        chat_elapsed = time.perf_counter() - chat_started
+
+        await asyncio.gather(*(s.close() for s in users + admins), return_exceptions=True)
+
+        fanout_complete = [max(latencies) for key, latencies in self.fanout.items()
+                           if len(latencies) >= self.admin_count]
+        fanout_each = [latency for latencies in self.fanout.values() for latency in latencies]
+        lost = len(self.sent) - len(self.delivered)
+        return {
+            "users": self.user_count,
+            "admins": self.admin_count,
+            "connect": dict(summarize(setup_latencies, connect_elapsed, connect_errors),
+                            connections_per_second=round(len(users) / connect_elapsed, 2) if connect_elapsed else None),
+            "delivery": summarize(list(self.delivered.values()), chat_elapsed, lost),
+            "fanout_each": summarize(fanout_each, chat_elapsed),
+            "fanout_complete": summarize(fanout_complete, chat_elapsed,
+                                         len(self.sent) - len(fanout_complete) if self.admin_count else 0),
+            "messages_sent": len(self.sent)
+        }
+
+    def _drained(self):
+        return len(self.delivered) >= len(self.sent) and all(
+            len(self.fanout[key]) >= self.admin_count for key in self.sent
+        )
+
+def print_point(point):
+    connect, delivery, fanout = point["connect"], point["delivery"], point["fanout_complete"]
+    print(f"   N={point['users']:<5} connect {connect['connections_per_second'] or 0:>8.1f}/s"
+          f"  delivery p50 {delivery['p50_ms'] or 0:>8.2f} p95 {delivery['p95_ms'] or 0:>8.2f}"
+          f" p99 {delivery['p99_ms'] or 0:>8.2f} ms"
+          f"  fan-out p95 {fanout['p95_ms'] or 0:>8.2f} ms"
+          f"  {delivery['throughput_rps'] or 0:>7.1f} msg/s  lost {delivery['errors']}")
+
+def capacity(points, slo_ms):
+    """Largest N whose p95 delivery and fan-out stay within the SLO without losses"""
+    best = None
+    for point in points:
+        sections = ["delivery", "fanout_complete"] if point["admins"] else ["delivery"]
+        within = all(
+            point[key]["p95_ms"] is not None and point[key]["p95_ms"] <= slo_ms and not point[key]["errors"]
+            for key in sections
+        ) and not point["connect"]["errors"]
+        if within:
+            best = point["users"]
+    return best
+
+async def run_curve(args, base_url):
+    points = []
+    for users in [int(n) for n in args.users.split(",")]:
+        scenario = ChatScenario(base_url, users, args.admins, args.messages,
+                                args.interval, args.drain_timeout)
+        point = await scenario.run()
+        print_point(point)
+        points.append(point)
+    return points
+
+def command_run(args):
+    print(f"🚀 Socket.IO capacity curve: users {args.users}, {args.admins} admins, "
+          f"{args.messages} messages every {args.interval}s")
+    if args.url:
+        points = asyncio.run(run_curve(args, args.url.rstrip("/")))
+    else:
+        with start_server(args.database_url) as base_url:
+            points = asyncio.run(run_curve(args, base_url))
+
+    best = capacity(points, args.slo_ms)
+    print(f"\n📈 Capacity within p95 {args.slo_ms} ms: "
+          f"{best if best is not None else 'below the smallest N'} concurrent users")
+    path = write_results("socket", {
+        "settings": {
+            "admins": args.admins,
+            "messages": args.messages,
+            "interval": args.interval,
+            "slo_ms": args.slo_ms
+        },
+        "curve": points,
+        "capacity_users": best
+    }, args.output)
+    print(f"📄 Results written to {path}")
+    return 0
+
+def _flatten(document, section, metric):
+    return {f"N={point['users']}/{section}": point[section].get(metric)
+            for point in document["results"]["curve"]}
+
+def command_compare(args):
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    print(f"Comparing {baseline.get('git_sha')} -> {current.get('git_sha')} (tolerance {args.tolerance:.0%})")
+
+    regressions = []
+    for section, metric, lower_is_better, unit in (("delivery", "p95_ms", True, "ms"),
+                                                   ("fanout_complete", "p95_ms", True, "ms"),
+                                                   ("connect", "connections_per_second", False, "/s")):
+        print(f"\n📊 {section} {metric}")
+        rows, regressed = compare_metrics(_flatten(baseline, section, metric),
+                                          _flatten(current, section, metric),
+                                          args.tolerance, lower_is_better)
+        print_comparison(rows, unit)
+        regressions.extend(f"{name} {metric}" for name in regressed)
+
+    print(f"\nCapacity: {baseline['results'].get('capacity_users')} -> {current['results'].get('capacity_users')} users")
+    if regressions:
+        print(f"\n⚠️  {len(regressions)} regressions beyond {args.tolerance:.0%}")
+        return 1
+    print("\n🎉 No regressions")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO chat benchmark for the Ares Club API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Measure a capacity curve")
+    run.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    run.add_argument("--database-url", help="Database for the started server (default: temporary SQLite)")
+    run.add_argument("--users", default="10,50,100,200", help="Comma separated numbers of concurrent users")
+    run.add_argument("--admins", type=int, default=3, help="Admins listening on the admins channel")
+    run.add_argument("--messages", type=int, default=5, help="Messages sent by each user")
+    run.add_argument("--interval", type=float, default=1.0, help="Seconds between messages of one user")
+    run.add_argument("--drain-timeout", type=float, default=10.0, help="Seconds to wait for pending deliveries")
+    run.add_argument("--slo-ms", type=float, default=250.0, help="p95 latency target for the capacity estimate")
+    run.add_argument("--output", help="Results file (default: benchmarks/results/socket-<sha>-<time>.json)")
+
+    compare = subparsers.add_parser("compare", help="Compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return command_run(args)
+    return command_compare(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
 -- Script SQL para crear las tablas de Ares Club Casino en PostgreSQL
 -- Ejecutar este script en pgAdmin4 conectado a tu base de datos de Railway
+-- Las tablas users, chat_rooms y chat_messages las crea SQLAlchemy al arrancar el
+-- servidor (database.create_tables); los nombres de índices coinciden con los suyos
 
 -- Crear tabla de contactos
 CREATE TABLE IF NOT EXISTS contacts (
@@ -9,6 +11,10 @@ CREATE TABLE IF NOT EXISTS contacts (
     email VARCHAR(120),
     message TEXT,
     source VARCHAR(50) DEFAULT 'whatsapp',
+    phone_key VARCHAR(20),
+    email_key VARCHAR(120),
+    submission_count INTEGER NOT NULL DEFAULT 1,
+    last_seen_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -16,14 +22,38 @@ CREATE TABLE IF NOT EXISTS contacts (
 CREATE INDEX IF NOT EXISTS idx_contacts_created_at ON contacts(created_at);
 CREATE INDEX IF NOT EXISTS idx_contacts_source ON contacts(source);
 
+-- Un contacto por teléfono y por email normalizados
+CREATE UNIQUE INDEX IF NOT EXISTS uq_contacts_phone_key ON contacts(phone_key) WHERE phone_key IS NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_contacts_email_key ON contacts(email_key) WHERE email_key IS NOT NULL;
+
+-- Crear tablas de dimensiones: cada nombre, user agent e IP se guarda una sola vez
+CREATE TABLE IF NOT EXISTS dim_entity_names (
+    id SERIAL PRIMARY KEY,
+    value VARCHAR(100) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS dim_user_agents (
+    id SERIAL PRIMARY KEY,
+    value_hash VARCHAR(64) NOT NULL UNIQUE,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dim_ip_addresses (
+    id SERIAL PRIMARY KEY,
+    value VARCHAR(45) NOT NULL UNIQUE
+);
+
 -- Crear tabla de interacciones con juegos
 CREATE TABLE IF NOT EXISTS game_interactions (
     id SERIAL PRIMARY KEY,
-    game_name VARCHAR(100) NOT NULL,
+    game_name_id INTEGER,
     interaction_type VARCHAR(50) DEFAULT 'click',
+    user_agent_id INTEGER,
+    ip_address_id INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    game_name VARCHAR(100),
     user_agent TEXT,
-    ip_address VARCHAR(45),
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    ip_address VARCHAR(45)
 );
 
 -- Crear índices para optimizar consultas de estadísticas
@@ -34,11 +64,14 @@ CREATE INDEX IF NOT EXISTS idx_game_interactions_type ON game_interactions(inter
 -- Crear tabla de interacciones con promociones
 CREATE TABLE IF NOT EXISTS promo_interactions (
     id SERIAL PRIMARY KEY,
-    promo_name VARCHAR(100) NOT NULL,
+    promo_name_id INTEGER,
     interaction_type VARCHAR(50) DEFAULT 'click',
+    user_agent_id INTEGER,
+    ip_address_id INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    promo_name VARCHAR(100),
     user_agent TEXT,
-    ip_address VARCHAR(45),
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    ip_address VARCHAR(45)
 );
 
 -- Crear índices para optimizar consultas de estadísticas
@@ -46,6 +79,96 @@ CREATE INDEX IF NOT EXISTS idx_promo_interactions_promo_name ON promo_interactio
 CREATE INDEX IF NOT EXISTS idx_promo_interactions_created_at ON promo_interactions(created_at);
 CREATE INDEX IF NOT EXISTS idx_promo_interactions_type ON promo_interactions(interaction_type);
 
+-- Crear tabla de agregados diarios de interacciones compactadas
+CREATE TABLE IF NOT EXISTS interaction_daily_stats (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(10) NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    interaction_type VARCHAR(50) NOT NULL,
+    day VARCHAR(10) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_interaction_daily_stats_key UNIQUE (kind, name, interaction_type, day)
+);
+
+CREATE INDEX IF NOT EXISTS ix_interaction_daily_stats_kind_day ON interaction_daily_stats(kind, day);
+
+-- Crear tabla de sketches HyperLogLog de visitantes únicos por entidad y día
+CREATE TABLE IF NOT EXISTS unique_visitor_sketches (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(10) NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    day VARCHAR(10) NOT NULL,
+    registers BYTEA NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_unique_visitor_sketches_key UNIQUE (kind, name, day)
+);
+
+CREATE INDEX IF NOT EXISTS ix_unique_visitor_sketches_kind_day ON unique_visitor_sketches(kind, day);
+
+-- Crear tabla de refresh tokens (rotación por familia de sesión)
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    id SERIAL PRIMARY KEY,
+    token_hash VARCHAR(64) NOT NULL,
+    user_id INTEGER NOT NULL,
+    family_id VARCHAR(32) NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    revoked_at TIMESTAMP WITH TIME ZONE,
+    replaced_by_id INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_refresh_tokens_token_hash ON refresh_tokens(token_hash);
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id ON refresh_tokens(user_id);
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_family_id ON refresh_tokens(family_id);
+
+-- Crear tabla de estado del limitador de intentos de login
+CREATE TABLE IF NOT EXISTS login_throttle_state (
+    key VARCHAR(200) PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_login_throttle_state_expires_at ON login_throttle_state(expires_at);
+
+-- Crear tabla de meses de chat archivados (NDJSON comprimido con gzip)
+CREATE TABLE IF NOT EXISTS chat_archives (
+    id SERIAL PRIMARY KEY,
+    room_id VARCHAR(100) NOT NULL,
+    period VARCHAR(7) NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    first_message_at TIMESTAMP WITH TIME ZONE,
+    last_message_at TIMESTAMP WITH TIME ZONE,
+    payload BYTEA NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_chat_archives_room_period UNIQUE (room_id, period)
+);
+
+CREATE INDEX IF NOT EXISTS ix_chat_archives_room_id ON chat_archives(room_id);
+
+-- Crear tabla de borrados de salas de chat en segundo plano
+CREATE TABLE IF NOT EXISTS chat_room_deletions (
+    id SERIAL PRIMARY KEY,
+    room_id VARCHAR(100) NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    max_message_id INTEGER,
+    messages_deleted INTEGER DEFAULT 0,
+    requested_by VARCHAR(50),
+    error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_chat_room_deletions_room_id ON chat_room_deletions(room_id);
+
+-- Índice de chat por sala y fecha: solo si SQLAlchemy ya creó chat_messages
+DO $$
+BEGIN
+    IF to_regclass('public.chat_messages') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS ix_chat_messages_room_created ON chat_messages(room_id, created_at);
+    END IF;
+END $$;
+
 -- Insertar algunos datos de ejemplo (opcional)
 -- Descomenta las siguientes líneas si quieres datos de prueba
 